@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import hashlib
+import mimetypes
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from network import RequestError
+
+IMG_SRC_PATTERN = re.compile(r"""(<img\b[^>]*?\bsrc\s*=\s*)(["'])(https?://[^"']+)\2""", re.IGNORECASE)
+
+
+class AssetLocalizer:
+    """
+    Download the images in problem statements to a content-addressed store shared by all books,
+    and point the statements to the local files
+    """
+    def __init__(self, requester, storage, assets_path, manifest, workers=4, max_size=5*1024*1024):
+        self.__requester = requester
+        self.__storage = storage
+        self.__assets_path = assets_path  # relative to the root of storage
+        self.__manifest = manifest
+        self.__max_size = max_size
+        self.__executor = ThreadPoolExecutor(max_workers=workers)
+        self.__lock = threading.Lock()
+        self.__downloading = {}  # url -> future, so one url is downloaded once at the same time
+        self.__failed_urls = set()  # not downloaded again in this run
+
+
+    def prefetch(self, contents):
+        """
+        Download the images of several statements concurrently
+        """
+        futures = []
+        for content in contents:
+            for url in self.__findURLs(content):
+                future = self.__submit(url)
+                if future is not None:
+                    futures.append(future)
+        for future in futures:
+            future.result()
+
+
+    def localize(self, content, problem_path):
+        """
+        Return the statement with image urls replaced by paths relative to problem_path (in storage).
+        Only the images downloaded by prefetch are replaced, the others keep the remote url.
+        """
+        def replaceURL(match):
+            file_name = self.__manifest.getAsset(match.group(3))
+            if file_name is None:
+                return match.group(0)
+            relative_path = os.path.relpath(os.path.join(self.__assets_path, file_name), problem_path)
+            return match.group(1) + match.group(2) + relative_path.replace(os.sep, "/") + match.group(2)
+        return IMG_SRC_PATTERN.sub(replaceURL, content)
+
+
+    def close(self):
+        self.__executor.shutdown()
+
+
+    def __findURLs(self, content):
+        return set(match.group(3) for match in IMG_SRC_PATTERN.finditer(content))
+
+
+    def __submit(self, url):
+        file_name = self.__manifest.getAsset(url)
+        if file_name is not None and self.__storage.exists(os.path.join(self.__assets_path, file_name)):
+            return None  # stored already, no request
+        with self.__lock:
+            if url in self.__failed_urls:
+                return None
+            future = self.__downloading.get(url)
+            submitted = future is None
+            if submitted:
+                future = self.__executor.submit(self.__download, url)
+                self.__downloading[url] = future
+        if submitted:  # called at once if done already, so not holding the lock
+            future.add_done_callback(lambda _: self.__forget(url))
+        return future
+
+
+    def __forget(self, url):
+        with self.__lock:
+            self.__downloading.pop(url, None)
+
+
+    def __download(self, url):
+        file_name = self.__fetch(url)
+        if file_name is None:
+            with self.__lock:
+                self.__failed_urls.add(url)
+        return file_name
+
+
+    def __fetch(self, url):
+        try:
+            response = self.__requester.request("GET", url, operation="asset", stream=True)
+        except RequestError as error:
+            print(" >> Download image failed, keep the remote one. {:s}".format(str(error)))
+            return None
+
+        with response:
+            if int(response.headers.get("Content-Length") or 0) > self.__max_size:
+                print(" >> Image too large, keep the remote one. {:s}".format(url))
+                return None
+            chunks, size = [], 0
+            for chunk in response.iter_content(chunk_size=64*1024):
+                size = size + len(chunk)
+                if size > self.__max_size:
+                    print(" >> Image too large, keep the remote one. {:s}".format(url))
+                    return None
+                chunks.append(chunk)
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        data = b"".join(chunks)
+
+        extension = os.path.splitext(urlparse(url).path)[1].lower()
+        if not re.match(r"^\.\w{1,5}$", extension):
+            extension = mimetypes.guess_extension(content_type) or ".bin"
+        file_name = hashlib.sha256(data).hexdigest() + extension
+
+        file_path = os.path.join(self.__assets_path, file_name)
+        if not self.__storage.exists(file_path):  # same image from another url is stored once
+            self.__storage.write(file_path, [data])
+        self.__manifest.setAsset(url, file_name)
+        return file_name
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end crawl benchmark against the local mock server
+
+python benchmark/bench.py --problems 10 100 1000 --latency 20 --workers 4
+python benchmark/bench.py --problems 1000 --compare benchmark/results/old.json
+
+Each problem count is run twice: "cold" with --no-cache, and "warm" with the statement cache
+filled by a crawl of the same account to another folder before the measured one.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+import contextlib
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description=" === LeetCode CN Crawler Benchmark ===")
+    parser.add_argument("--problems", type=int, nargs="+", default=[10, 100, 1000],
+                        help="numbers of AC problems of the synthetic accounts (default 10 100 1000)")
+    parser.add_argument("--latency", type=float, default=20.0, help="latency of each response in ms (default 20)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="rate of 5xx responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="rate of 429 responses")
+    parser.add_argument("--null-rate", type=float, default=0.0, help="rate of null submissionDetail entries")
+    parser.add_argument("--images", type=int, default=0, help="number of distinct images shown in statements")
+    parser.add_argument("--crawler-args", type=str, default="-w 4 -r 0",
+                        help="arguments passed to the crawler, plus --no-cache in cold cases (default \"-w 4 -r 0\")")
+    parser.add_argument("--cache", type=str, nargs="+", default=["cold", "warm"], choices=["cold", "warm"],
+                        help="statement cache states to run (default cold warm)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="result JSON file (default benchmark/results/bench-<time>.json)")
+    parser.add_argument("--compare", type=str, default=None, help="result JSON file of an old run to compare with")
+    parser.add_argument("--single", type=str, default=None, help=argparse.SUPPRESS)  # run one case in this process
+    return parser.parse_args()
+
+
+def findFreePort():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def getServerStats(server_url):
+    with urllib.request.urlopen(server_url + "__stats__") as response:
+        return json.loads(response.read())
+
+
+def startServer(case):
+    port = findFreePort()
+    server_url = "http://127.0.0.1:{:d}/".format(port)
+    server = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "mock_server.py"), "--port", str(port),
+                               "--problems", str(case["problems"]), "--latency", str(case["latency"]),
+                               "--error-rate", str(case["error_rate"]), "--throttle-rate", str(case["throttle_rate"]),
+                               "--null-rate", str(case["null_rate"]), "--images", str(case["images"])],
+                              stdout=subprocess.DEVNULL)
+    for _ in range(100):  # wait for the server ready
+        try:
+            getServerStats(server_url)
+            return server, server_url
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("Mock server not started.")
+
+
+def crawlOnce(save_path, crawler_args):
+    """
+    Crawl the mock account into save_path, return the run report (None if login failed) and the wall time
+    """
+    import main
+    from client import LeetCodeClient
+
+    lc_client = LeetCodeClient(save_path, main.parseArgs(crawler_args))
+    try:
+        if not lc_client.login("mock-user", "mock-password"):
+            return None, 0.0
+        start_time = time.perf_counter()
+        report = lc_client.graspAllProblems("all")
+        return report, time.perf_counter() - start_time
+    finally:
+        lc_client.close()  # the queued writes are part of the crawl
+
+
+def diffStats(stats, old_stats):
+    """
+    Server stats of the requests between two snapshots
+    """
+    diff = {key: value - old_stats[key] for key, value in stats.items() if key != "operations"}
+    diff["operations"] = {operation: count - old_stats["operations"].get(operation, 0)
+                          for operation, count in stats["operations"].items()
+                          if count != old_stats["operations"].get(operation, 0)}
+    return diff
+
+
+def runSingle(case):
+    """
+    Crawl a synthetic account in this process, return the measurements
+    A case fails if the login or any problem failed, its rates are not comparable then.
+    """
+    server, server_url = startServer(case)
+    work_dir = tempfile.mkdtemp(prefix="lc_bench_")
+    try:
+        save_path = os.path.join(work_dir, "problems")
+        crawler_args = case["crawler_args"].split() + ["--server", server_url, "--no-session",
+                                                       "--cache-dir", os.path.join(work_dir, "cache")]
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            if case["cache"] == "warm":  # fill the statement cache, not measured
+                crawlOnce(os.path.join(work_dir, "warmup"), crawler_args)
+            old_stats = getServerStats(server_url)
+            report, wall_time = crawlOnce(save_path, crawler_args)
+        stats = diffStats(getServerStats(server_url), old_stats)
+
+        bytes_written, files_written = 0, 0
+        for dir_path, _, file_names in os.walk(save_path):
+            for file_name in file_names:
+                bytes_written = bytes_written + os.path.getsize(os.path.join(dir_path, file_name))
+                files_written = files_written + 1
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    failed = report is None or report["problems_failed"] > 0
+    return {
+        "problems": case["problems"],
+        "cache": case["cache"],
+        "failed": failed,
+        "problems_done": report["problems_done"] if report is not None else 0,
+        "problems_failed": report["problems_failed"] if report is not None else case["problems"],
+        "wall_time": round(wall_time, 3),
+        "problems_per_sec": round(case["problems"] / wall_time, 2) if not failed else None,
+        "requests": stats["requests"],
+        "requests_per_problem": round(stats["requests"] / case["problems"], 2),
+        "requests_by_operation": stats["operations"],
+        "bytes_received": stats["bytes_sent"],
+        "bytes_written": bytes_written,
+        "files_written": files_written,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "server_errors": stats["errors"],
+        "server_throttled": stats["throttled"],
+        "server_null_entries": stats["null_entries"]
+    }
+
+
+def getGitCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def printCompare(results, old_report):
+    # results of older versions are all cold
+    old_results = {(result["problems"], result.get("cache", "cold")): result for result in old_report["results"]}
+    print(" >> Compare with {:s} (commit {:s}):".format(old_report["time"], str(old_report["commit"])))
+    for result in results:
+        old_result = old_results.get((result["problems"], result["cache"]))
+        if old_result is None or result["failed"] or old_result.get("failed") or not old_result["problems_per_sec"]:
+            continue
+        print(" >> {:6d} problems {:4s}: {:8.2f} -> {:8.2f} problems/s ({:+.1f}%), {:6.2f} -> {:6.2f} requests/problem".format(
+              result["problems"], result["cache"], old_result["problems_per_sec"], result["problems_per_sec"],
+              (result["problems_per_sec"] / old_result["problems_per_sec"] - 1) * 100,
+              old_result["requests_per_problem"], result["requests_per_problem"]))
+
+
+def main():
+    args = parseArgs()
+    if args.single is not None:  # child process
+        print(json.dumps(runSingle(json.loads(args.single))))
+        return
+
+    config = {"latency": args.latency, "error_rate": args.error_rate, "throttle_rate": args.throttle_rate,
+              "null_rate": args.null_rate, "images": args.images, "crawler_args": args.crawler_args}
+    results = []
+    for problem_count in args.problems:
+        for cache in args.cache:
+            crawler_args = args.crawler_args + (" --no-cache" if cache == "cold" else "")
+            case = dict(config, problems=problem_count, cache=cache, crawler_args=crawler_args)
+            # one process per case, so that peak RSS is measured separately
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--single", json.dumps(case)])
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            results.append(result)
+            if result["failed"]:
+                print(" >> {:6d} problems {:4s}: FAILED, {:d} problems failed".format(
+                      result["problems"], result["cache"], result["problems_failed"]))
+                continue
+            print(" >> {:6d} problems {:4s}: {:8.3f} s, {:8.2f} problems/s, {:6.2f} requests/problem, peak RSS {:d} KB, {:d} bytes written"
+                  .format(result["problems"], result["cache"], result["wall_time"], result["problems_per_sec"],
+                          result["requests_per_problem"], result["peak_rss_kb"], result["bytes_written"]))
+
+    report = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": getGitCommit(),
+              "python": sys.version.split()[0], "config": config, "results": results}
+    output_path = args.output
+    if output_path is None:
+        output_path = os.path.join(BENCH_DIR, "results", "bench-{:s}.json".format(time.strftime("%Y%m%d-%H%M%S")))
+    if os.path.dirname(output_path) != "" and not os.path.exists(os.path.dirname(output_path)):
+        os.makedirs(os.path.dirname(output_path))
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(" >> Results saved to {:s}".format(output_path))
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            printCompare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
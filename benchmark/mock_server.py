@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in of leetcode-cn.com for benchmarks, serving a synthetic account
+
+python benchmark/mock_server.py --port 8000 --problems 1000 --latency 20
+"""
+
+import re
+import gzip
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+BOOK_LIST = ["algorithms", "database", "shell", "concurrency", "lcci", "lcof"]
+
+
+class MockAccount:
+    """
+    Synthetic account with AC problems spread over the books
+    Every 10th algorithms problem is also in lcof, to exercise the cross-book dedup.
+    """
+    def __init__(self, problem_count, attempts=3, content_size=2048, attempts_after_ac=0, seed=0):
+        rand = random.Random(seed)
+        self.problems = []  # { qid, slug, title, book_list, difficulty, submissions(newest first) }
+        self.submissions = []  # all submissions of the account, newest first
+        submission_id = 100000
+        timestamp = 1600000000
+        for idx in range(problem_count):
+            book = "algorithms" if idx % 20 < 16 else BOOK_LIST[1 + idx % 4]  # database, shell, concurrency, lcci
+            problem = {
+                "qid": str(idx + 1),
+                "slug": "problem-{:d}".format(idx + 1),
+                "title": "Problem {:d}".format(idx + 1),
+                "books": [book] + (["lcof"] if idx % 10 == 0 and book == "algorithms" else []),
+                "difficulty": rand.choice(["Easy", "Medium", "Hard"]),
+                "submissions": []
+            }
+            for attempt_idx in range(attempts + attempts_after_ac):  # the last attempt is accepted, then the failed ones
+                submission_id = submission_id + 1
+                timestamp = timestamp + 60
+                submission = {
+                    "id": str(submission_id),
+                    "slug": problem["slug"],
+                    "title": problem["title"],
+                    "statusDisplay": "Accepted" if attempt_idx == attempts - 1 else "Wrong Answer",
+                    "lang": rand.choice(["cpp", "python3", "java", "golang"]),
+                    "timestamp": str(timestamp),
+                    "url": "/submissions/detail/{:d}/".format(submission_id),
+                    "code": "// solution of problem {:d}\n".format(idx + 1) + "// padding\n" * 20
+                }
+                problem["submissions"].insert(0, submission)
+                self.submissions.insert(0, submission)
+            problem["content"] = "<p>Statement of problem {:d}.</p>\n".format(idx + 1) + "<p>" + "x" * content_size + "</p>\n"
+            self.problems.append(problem)
+        self.problems_by_slug = {problem["slug"]: problem for problem in self.problems}
+        self.submissions_by_id = {submission["id"]: submission for submission in self.submissions}
+
+
+    def submit(self, slug, status="Accepted", lang="cpp"):
+        """
+        Add a new submission of a problem, e.g. for watch mode
+        """
+        problem = self.problems_by_slug[slug]
+        newest = self.submissions[0]
+        submission_id = str(int(newest["id"]) + 1)
+        submission = {"id": submission_id, "slug": slug, "title": problem["title"], "statusDisplay": status, "lang": lang,
+                      "timestamp": str(int(newest["timestamp"]) + 60), "url": "/submissions/detail/{:s}/".format(submission_id),
+                      "code": "// new solution of {:s}\n".format(slug)}
+        problem["submissions"].insert(0, submission)
+        self.submissions.insert(0, submission)
+        self.submissions_by_id[submission_id] = submission
+        return submission
+
+
+class MockServer:
+    """
+    Serve the mock account in a background thread, with configurable latency and failures
+    """
+    def __init__(self, account, port=0, latency=0.0, error_rate=0.0, throttle_rate=0.0, null_rate=0.0, images=0, seed=0):
+        self.account = account
+        self.images = images  # number of distinct images, shared by the statements
+        self.latency = latency  # seconds
+        self.error_rate = error_rate  # 5xx responses
+        self.throttle_rate = throttle_rate  # 429 responses
+        self.null_rate = null_rate  # null submissionDetail entries
+        self.rand = random.Random(seed)
+        self.lock = threading.Lock()
+        self.resetStats()
+
+        handler = type("MockHandler", (MockHandler,), {"server_state": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.url = "http://127.0.0.1:{:d}/".format(self.port)
+        self.thread = None
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+    def resetStats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "bytes_sent": 0, "errors": 0, "throttled": 0, "null_entries": 0, "operations": {}}
+
+
+    def count(self, operation, bytes_sent):
+        with self.lock:
+            self.stats["requests"] = self.stats["requests"] + 1
+            self.stats["bytes_sent"] = self.stats["bytes_sent"] + bytes_sent
+            self.stats["operations"][operation] = self.stats["operations"].get(operation, 0) + 1
+
+
+    def chance(self, rate):
+        with self.lock:
+            return self.rand.random() < rate
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state = None
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/__stats__":
+            with self.server_state.lock:
+                return self.__sendJSON(dict(self.server_state.stats), count=False)
+        if self.__injectFailure():
+            return
+
+        match = re.match(r"^/static/img/(\d+)\.png$", url.path)
+        if match is not None:
+            body = b"\x89PNG\r\n\x1a\n" + match.group(1).encode() * 1024
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            self.server_state.count("image", len(body))
+            return
+
+        match = re.match(r"^/api/problems/(\w+)/$", url.path)
+        if match is not None:
+            return self.__sendJSON(self.__problemsList(match.group(1)), operation="problems")
+        if url.path == "/api/submissions/":
+            query = parse_qs(url.query)
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["20"])[0])
+            with self.server_state.lock:
+                etag = "\"{:s}-{:d}-{:d}\"".format(self.server_state.account.submissions[0]["id"], offset, limit)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                self.server_state.count("api_submissions_304", 0)
+                return
+            return self.__sendJSON(self.__submissionsDump(offset, limit), operation="api_submissions", headers={"ETag": etag})
+        self.__sendJSON({"detail": "Not found."}, status=404, operation="not_found")
+
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        url = urlparse(self.path)
+        if url.path == "/accounts/login/":
+            self.server_state.count("login", 0)
+            self.send_response(200)
+            self.send_header("Set-Cookie", "csrftoken=mock-csrf; Path=/")
+            self.send_header("Set-Cookie", "LEETCODE_SESSION=mock-session; Path=/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if url.path == "/__submit__":
+            param = json.loads(body)
+            with self.server_state.lock:
+                submission = self.server_state.account.submit(param["slug"], param.get("status", "Accepted"),
+                                                              param.get("lang", "cpp"))
+            return self.__sendJSON({"id": submission["id"]}, count=False)
+        if url.path != "/graphql/":
+            return self.__sendJSON({"detail": "Not found."}, status=404, operation="not_found")
+        if self.__injectFailure():
+            return
+
+        param = json.loads(body)
+        operation_name = param["operationName"]
+        if operation_name == "userStatus":
+            return self.__sendJSON({"data": {"userStatus": {"userSlug": "mock-user", "isSignedIn": True}}}, operation="userStatus")
+        if operation_name == "submissions":
+            return self.__sendJSON({"data": {"submissionList": self.__submissionList(param["variables"])}}, operation="submissions")
+
+        # aliased batch queries: "q0: question(titleSlug: $v0)", or the plain single one
+        data = {}
+        for alias, field_name, variable in re.findall(r"(?:(\w+)\s*:\s*)?(question|submissionDetail)\(\w+:\s*\$(\w+)\)", param["query"]):
+            value = param["variables"][variable]
+            data[alias or field_name] = self.__question(value) if field_name == "question" else self.__submissionDetail(value)
+        self.__sendJSON({"data": data}, operation=operation_name)
+
+
+    def __injectFailure(self):
+        if self.server_state.latency > 0:
+            time.sleep(self.server_state.latency)
+        if self.server_state.chance(self.server_state.throttle_rate):
+            with self.server_state.lock:
+                self.server_state.stats["throttled"] = self.server_state.stats["throttled"] + 1
+            self.__sendJSON({"detail": "Throttled."}, status=429, operation="throttled", headers={"Retry-After": "1"})
+            return True
+        if self.server_state.chance(self.server_state.error_rate):
+            with self.server_state.lock:
+                self.server_state.stats["errors"] = self.server_state.stats["errors"] + 1
+            self.__sendJSON({"detail": "Server error."}, status=502, operation="error")
+            return True
+        return False
+
+
+    def __problemsList(self, book_name):
+        pairs = []
+        for problem in self.server_state.account.problems:
+            if book_name not in problem["books"]:
+                continue
+            qid = problem["qid"] if book_name != "lcof" else "剑指 Offer {:s}".format(problem["qid"])
+            pairs.append({"status": "ac", "stat": {"frontend_question_id": qid,
+                                                   "question__title": problem["title"],
+                                                   "question__title_slug": problem["slug"]}})
+        return {"user_name": "mock-user", "num_solved": len(pairs), "stat_status_pairs": pairs}
+
+
+    def __submissionsDump(self, offset, limit):
+        submissions = self.server_state.account.submissions[offset:offset+limit]
+        dump = [{"id": int(submission["id"]), "lang": submission["lang"], "timestamp": int(submission["timestamp"]),
+                 "status_display": submission["statusDisplay"], "title": submission["title"],
+                 "title_slug": submission["slug"], "url": submission["url"]} for submission in submissions]
+        has_next = offset + limit < len(self.server_state.account.submissions)
+        return {"submissions_dump": dump, "has_next": has_next, "last_key": str(offset + limit) if has_next else ""}
+
+
+    def __submissionList(self, variables):
+        problem = self.server_state.account.problems_by_slug.get(variables["questionSlug"])
+        submissions = problem["submissions"] if problem is not None else []
+        if variables.get("lang"):
+            submissions = [submission for submission in submissions if submission["lang"] == variables["lang"]]
+        offset = int(variables["lastKey"]) if variables.get("lastKey") not in (None, "null", "") else variables.get("offset", 0)
+        limit = variables.get("limit", 20)
+        page = submissions[offset:offset+limit]
+        has_next = offset + limit < len(submissions)
+        return {"lastKey": str(offset + limit) if has_next else None, "hasNext": has_next,
+                "submissions": [{"id": submission["id"], "statusDisplay": submission["statusDisplay"],
+                                 "lang": submission["lang"], "timestamp": submission["timestamp"],
+                                 "url": submission["url"]} for submission in page]}
+
+
+    def __question(self, slug):
+        problem = self.server_state.account.problems_by_slug.get(slug)
+        if problem is None:
+            return None
+        content = problem["content"]
+        if self.server_state.images > 0:
+            content = content + "<p><img alt=\"\" src=\"{:s}static/img/{:d}.png\" /></p>\n".format(
+                    self.server_state.url, int(problem["qid"]) % self.server_state.images)
+        return {"questionId": problem["qid"], "questionFrontendId": problem["qid"], "categoryTitle": "Algorithms",
+                "title": problem["title"], "titleSlug": slug, "translatedTitle": "题目{:s}".format(problem["qid"]),
+                "translatedContent": content, "difficulty": problem["difficulty"],
+                "topicTags": [{"name": "Array", "slug": "array", "translatedName": "数组"}]}
+
+
+    def __submissionDetail(self, submission_id):
+        submission = self.server_state.account.submissions_by_id.get(str(submission_id))
+        if submission is None:
+            return None
+        if self.server_state.chance(self.server_state.null_rate):
+            with self.server_state.lock:
+                self.server_state.stats["null_entries"] = self.server_state.stats["null_entries"] + 1
+            return None
+        problem = self.server_state.account.problems_by_slug[submission["slug"]]
+        return {"id": submission["id"], "code": submission["code"], "lang": submission["lang"],
+                "statusDisplay": submission["statusDisplay"], "timestamp": int(submission["timestamp"]),
+                "question": {"titleSlug": problem["slug"], "title": problem["title"],
+                             "translatedTitle": "题目{:s}".format(problem["qid"]), "questionId": problem["qid"]}}
+
+
+    def __sendJSON(self, obj, status=200, operation=None, headers=None, count=True):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        if "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 256:
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        if count:
+            self.server_state.count(operation, len(body))
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description=" === LeetCode CN Mock Server ===")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--problems", type=int, default=100, help="number of AC problems of the account")
+    parser.add_argument("--attempts", type=int, default=3, help="submissions per problem, the last is accepted")
+    parser.add_argument("--attempts-after-ac", type=int, default=0, help="failed submissions per problem after the accepted one")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency of each response in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="rate of 5xx responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="rate of 429 responses")
+    parser.add_argument("--null-rate", type=float, default=0.0, help="rate of null submissionDetail entries")
+    parser.add_argument("--images", type=int, default=0, help="number of distinct images shown in statements")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parseArgs()
+    account = MockAccount(args.problems, attempts=args.attempts, attempts_after_ac=args.attempts_after_ac)
+    server = MockServer(account, port=args.port, latency=args.latency / 1000.0, error_rate=args.error_rate,
+                        throttle_rate=args.throttle_rate, null_rate=args.null_rate, images=args.images)
+    print(" >> Mock server listening on {:s} with {:d} problems.".format(server.url, args.problems))
+    server.start()
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
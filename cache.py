@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import contextlib
+
+
+class ResponseCache:
+    """
+    On-disk cache of GraphQL responses, keyed by operation name, variables and query
+    Only the operations with a TTL are cached. Least recently used entries are
+    evicted when the cache is larger than max_size bytes.
+    """
+    LOCK_STRIPES = 64
+
+    def __init__(self, cache_dir, ttls, max_size=512*1024*1024):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.__cache_dir = cache_dir
+        self.__ttls = ttls  # operation name -> seconds
+        self.__max_size = max_size
+        self.__lock = threading.Lock()
+        self.__entry_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+        self.__size = 0
+        for entry_path in self.__listEntries():
+            self.__size = self.__size + os.path.getsize(entry_path)
+
+
+    def get(self, operation_name, variables, query):
+        """
+        Return the cached data, None if missing or expired
+        """
+        if operation_name not in self.__ttls:
+            return None
+        entry_path = self.__entryPath(operation_name, variables, query)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry["time"] > self.__ttls[operation_name]:
+            self.__remove(entry_path)
+            return None
+        try:
+            os.utime(entry_path)  # mark as recently used
+        except OSError:
+            pass
+        return entry["data"]
+
+
+    def set(self, operation_name, variables, query, data):
+        if operation_name not in self.__ttls or data is None:
+            return
+        entry_path = self.__entryPath(operation_name, variables, query)
+        entry_dir = os.path.dirname(entry_path)
+        if not os.path.exists(entry_dir):
+            os.makedirs(entry_dir, exist_ok=True)
+
+        # write to a temp file then rename, readers never see a half-written entry
+        fd, temp_path = tempfile.mkstemp(dir=entry_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"time": time.time(), "data": data}, f, ensure_ascii=False)
+        old_size = os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+        new_size = os.path.getsize(temp_path)
+        os.replace(temp_path, entry_path)
+
+        with self.__lock:
+            self.__size = self.__size + new_size - old_size
+            need_evict = self.__size > self.__max_size
+        if need_evict:
+            self.__evict()
+
+
+    @contextlib.contextmanager
+    def locking(self, operation_name, variables_list, query):
+        """
+        Hold the entries while querying them, so that the clients sharing this cache
+        query one entry once, e.g.
+            with cache.locking(...): get again, query the still missing ones, set
+        """
+        stripes = sorted(set(int(os.path.basename(self.__entryPath(operation_name, variables, query))[:8], 16)
+                             % self.LOCK_STRIPES for variables in variables_list))  # same order in every thread
+        for stripe in stripes:
+            self.__entry_locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self.__entry_locks[stripe].release()
+
+
+    def __entryPath(self, operation_name, variables, query):
+        key_json = json.dumps({"operationName": operation_name, "variables": variables, "query": query},
+                              sort_keys=True, ensure_ascii=False)
+        key = hashlib.sha256(key_json.encode("utf-8")).hexdigest()
+        return os.path.join(self.__cache_dir, operation_name, key[:2], key + ".json")
+
+
+    def __listEntries(self):
+        for dir_path, _, file_names in os.walk(self.__cache_dir):
+            for file_name in file_names:
+                if file_name.endswith(".json"):
+                    yield os.path.join(dir_path, file_name)
+
+
+    def __remove(self, entry_path):
+        try:
+            size = os.path.getsize(entry_path)
+            os.remove(entry_path)
+        except OSError:
+            return
+        with self.__lock:
+            self.__size = self.__size - size
+
+
+    def __evict(self):
+        """
+        Remove the least recently used entries until the cache is 90% of max size
+        """
+        entries = []
+        for entry_path in self.__listEntries():
+            try:
+                entries.append((os.path.getmtime(entry_path), entry_path))
+            except OSError:
+                continue
+        entries.sort()
+
+        for _, entry_path in entries:
+            with self.__lock:
+                if self.__size <= self.__max_size * 0.9:
+                    return
+            self.__remove(entry_path)
@@ -5,292 +5,952 @@ import re
 import sys
 import time
 import json
-import glob
+import threading
+import functools
 import requests
+from urllib3.util.request import ACCEPT_ENCODING
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
 import utils
+from network import RateLimiter, RetryPolicy, CircuitBreaker, HTTPRequester, parseJSON, parseGraphQL
+from network import RequestError, AuthExpiredError
+from manifest import Manifest
+from cache import ResponseCache
+from metrics import Metrics, writeAtomically
+from assets import AssetLocalizer
+from storage import openStorage, StorageWriter
+import queries
 
 class LeetCodeClient:
     """
     LeetCode Client
     """ 
-    def __init__(self, username, password, save_path, args):
-        self.__username = username
-        self.__password = password
+    def __init__(self, save_path, args, team=None):
+        """
+        team: TeamResources shared with the other accounts crawled in this process, if any
+        """
         self.__save_path = save_path
         self.__debug_mode = args.debug
+        self.__fields = args.fields  # GraphQL field profile, see queries.py
         self.__force_mode = args.force
-
+        self.__incremental_mode = args.incremental
+        self.__history_mode = args.history
+        self.__history_langs = set(args.history_lang) if args.history_lang else None
+        self.__history_status = args.history_status
+        # recorded with the newest history submission, a walk with other filters does not stop there
+        self.__history_filter = json.dumps({"lang": sorted(self.__history_langs) if self.__history_langs else None,
+                                            "status": self.__history_status})
+        self.__workers = max(1, args.workers)
+        self.__batch_size = max(1, args.batch_size)
+        self.__page_size = max(1, args.page_size)
+        timeout = tuple(args.timeout)  # (connect, read) seconds
+
+        # one shared session, its connection pool sized for all the workers
         self.__client = requests.session()
         self.__client.encoding = "utf-8"
-        self.__problems_info = []  # { qid, title, url, grasped, 
-                                   #   translated_title(if grasped) }
+        self.__client.headers["Accept-Encoding"] = ACCEPT_ENCODING  # gzip, and br if brotli is installed
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=self.__workers)
+        self.__client.mount("https://", adapter)
+        self.__client.mount("http://", adapter)
+        self.__metrics = Metrics()
+        self.__executor = team.executor if team is not None else None
+        rate_limiter = team.rate_limiter if team is not None else RateLimiter(args.rate)
+        self.__requester = HTTPRequester(self.__client, rate_limiter,
+                                         RetryPolicy(max_retries=5, base_delay=1.0, max_delay=30.0, retry_budget=200),
+                                         CircuitBreaker(failure_threshold=5, cooldown=30.0), self.__metrics, timeout)
+        self.__report_file = args.report if args.report is not None else os.path.join(save_path, "crawl_report.json")
+        self.__prometheus_file = args.prometheus
+        self.__print_lock = threading.Lock()
+        self.__manifest = Manifest(save_path)
+        self.__output_format = args.output_format
+        self.__storage = openStorage(args.output_format, save_path)
+        self.__writer = StorageWriter(self.__storage, self.__metrics)  # the write stage, behind the fetching
+        self.__cache = None
+        if team is not None:  # statements are queried once for the whole team
+            self.__cache = team.cache
+        elif not args.no_cache:  # problem statements almost never change, submissions are not cached
+            self.__cache = ResponseCache(args.cache_dir, {"questionData": 30 * 24 * 3600},
+                                         max_size=args.cache_size * 1024 * 1024)
+        self.__assets = None
+        self.__asset_requester = None
+        if args.assets:  # images have their own connection pool, not limited by the rate of LeetCode API
+            asset_client = requests.session()
+            asset_adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.asset_workers)
+            asset_client.mount("https://", asset_adapter)
+            asset_client.mount("http://", asset_adapter)
+            self.__asset_requester = HTTPRequester(asset_client, RateLimiter(0),
+                                                   RetryPolicy(max_retries=2, base_delay=1.0, max_delay=10.0, retry_budget=100),
+                                                   CircuitBreaker(failure_threshold=10, cooldown=10.0), self.__metrics, timeout)
+            self.__assets = AssetLocalizer(self.__asset_requester, self.__storage, "assets", self.__manifest,
+                                           workers=args.asset_workers, max_size=args.asset_max_size * 1024 * 1024)
+        self.__processing_idx = 0
+        self.__processing_total = 0
         self.__account_name = None
         self.__signed_in = False
-        self.__book_name = ""
 
-        self.__login_retry_times = 3  # >= 1
-        self.__submission_retry_times = 20  # >= 3
+        # rounds of querying the null entries of a batch again, other failures are retried by requester
+        self.__submission_retry_times = 6  # >= 3
+        self.__problem_retry_times = 3  # >= 1
 
-        self.__leetcode_url = "https://leetcode-cn.com/"
+        self.__leetcode_url = args.server.rstrip("/") + "/"
         self.__query_url = self.__leetcode_url + "graphql/"
         self.__sign_in_url = self.__leetcode_url + "accounts/login/"
         self.__problem_list_url = self.__leetcode_url + "api/problems/"
         self.__problem_url = self.__leetcode_url + "problems/"
         self.__submissions_url = self.__leetcode_url + "submissions/"
+        self.__submissions_api_url = self.__leetcode_url + "api/submissions/"
 
         self.__valid_book_list = ["algorithms", "database", "shell", "concurrency", "lcci", "lcof"]
 
 
-    def login(self, retry_time_interval=5.0):
+    def login(self, username, password):
         """
         Web Client Login
         """
-        retry_times = self.__login_retry_times
-        
-        while retry_times > 0:
-            try:
-                # Login
-                login_data = {"login": self.__username, "password": self.__password}            
-                login_response = self.__client.post(self.__sign_in_url, data=login_data, headers=dict(Referer=self.__sign_in_url))
-
-                # Get account name, check if signed in.
-                # If not signed in, account name will not be received.
-                account_name_headers = self.__postHTTPJSONHeader(Referer=self.__query_url)
-
-                json_query = "query userStatus {\n  userStatus {\n    userSlug\n  }\n}\n"
-                account_name_param = self.__postHTTPJSONParam("userStatus", {}, json_query)
-
-                param_json = json.dumps(account_name_param).encode("utf-8")
-                account_name_response = self.__client.post(self.__query_url, data=param_json, headers=account_name_headers)
-                self.__account_name = account_name_response.json()["data"]["userStatus"]["userSlug"]
-                self.__signed_in = (self.__account_name != None)
-
-                # Check results
-                if not login_response.ok:
-                    print(" >> Login failed. Not OK response from server. Retry in {:.1f} seconds...")
-                    retry_times = retry_times - 1
-                    time.sleep(retry_time_interval)
-                elif not self.__signed_in:
-                    print(" >> Login failed. Wrong password.")
-                    return False
-                else:
-                    print(" >> Login successfully.\n >> Welcome, {:s}!".format(self.__account_name))
-                    return True
-
-            except:
-                print(" >> Login failed. Connection failed. Retry in {:.1f} seconds...".format(retry_time_interval))
-                retry_times = retry_times - 1
-                time.sleep(retry_time_interval)
-        return False
+        try:
+            # Login
+            login_data = {"login": username, "password": password}
+            self.__requester.request("POST", self.__sign_in_url, operation="login",
+                                     data=login_data, headers=dict(Referer=self.__sign_in_url))
+            self.__checkSignedIn()
+        except RequestError as error:
+            print(" >> Login failed. {:s}".format(str(error)))
+            return False
+
+        # Check results
+        if not self.__signed_in:
+            print(" >> Login failed. Wrong password.")
+            return False
+        print(" >> Login successfully.\n >> Welcome, {:s}!".format(self.__account_name))
+        return True
+
+
+    def restoreSession(self, session_file, username=None):
+        """
+        Restore the cookies saved by last run, and check if still signed in
+        If username is given, the session must be saved by the login of the same username.
+        """
+        if not os.path.exists(session_file):
+            return False
+        try:
+            with open(session_file, "r", encoding="utf-8") as f:
+                session = json.load(f)
+            if username is not None and session.get("username") != username:
+                print(" >> Saved session is not of {:s}. Please login again.".format(username))
+                return False
+            for cookie in session["cookies"]:
+                self.__client.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"])
+            self.__checkSignedIn()
+        except (OSError, ValueError, KeyError, RequestError) as error:
+            print(" >> Restore session failed. {:s}".format(str(error)))
+            self.__client.cookies.clear()
+            return False
+
+        if not self.__signed_in:
+            print(" >> Saved session expired. Please login again.")
+            self.__client.cookies.clear()
+            return False
+        print(" >> Restore session successfully.\n >> Welcome, {:s}!".format(self.__account_name))
+        return True
+
+
+    def saveSession(self, session_file, username):
+        """
+        Save the cookies (with CSRF token) and the login username to a file only readable by current user
+        """
+        session_dir = os.path.dirname(session_file)
+        if session_dir != "" and not os.path.exists(session_dir):
+            os.makedirs(session_dir, mode=0o700)
+
+        cookies = [{"name": cookie.name, "value": cookie.value, "domain": cookie.domain, "path": cookie.path}
+                   for cookie in self.__client.cookies]
+        fd = os.open(session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(session_file, 0o600)  # in case the file existed with other mode
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"username": username, "account": self.__account_name, "cookies": cookies}, f)
+
+
+    def close(self):
+        """
+        Finish the queued writes, then release the threads, archive and manifest of the client
+        """
+        if self.__assets is not None:
+            self.__assets.close()
+            self.__asset_requester.session.close()
+        self.__writer.close()
+        self.__storage.close()
+        self.__manifest.close()
+        self.__client.close()
+
+
+    def __checkSignedIn(self):
+        # Get account name, check if signed in.
+        # If not signed in, account name will not be received.
+        json_query = "query userStatus {\n  userStatus {\n    userSlug\n  }\n}\n"
+        account_name_param = self.__postHTTPJSONParam("userStatus", {}, json_query)
+        self.__account_name = self.__postGraphQL(account_name_param, self.__query_url)["userStatus"]["userSlug"]
+        self.__signed_in = (self.__account_name != None)
+
+
+    def rebuildIndex(self):
+        """
+        Rebuild the manifest from the grasped problems tree, no need to login
+        """
+        if self.__output_format != "tree":
+            print(" >> Rebuild index only works with the tree output. Please export the archive first.")
+            return
+        length = self.__manifest.rebuild(self.__valid_book_list)
+        print(" >> Rebuild index successfully. Found {:d} problems.".format(length))
+        for book in self.__valid_book_list:
+            if os.path.isdir(os.path.join(self.__save_path, book)):
+                self.__generateListFile(book)
 
 
     def graspAllProblems(self, book_name):
+        """
+        Return the run report, None if not signed in
+        """
         if not self.__signed_in:
             print(" >> Not signed in yet. Please login first.")
-            return
+            return None
+
+        try:
+            self.__graspAllProblems(book_name)
+        finally:
+            self.__writer.flush()
+            self.__storage.commit()
+            report = self.__writeRunReport()
+        return report
+
+
+    def watch(self, book_name, interval=300.0, max_interval=3600.0, status_file=None):
+        """
+        Grasp all the problems once, then poll the newest submission of the account every interval seconds,
+        and grasp only the problems with new AC submissions. Failed polls back off up to max_interval.
+        Return False when the session expired, so the caller can login again.
+        """
+        if not self.__signed_in:
+            print(" >> Not signed in yet. Please login first.")
+            return False
+        if book_name != "all" and book_name not in self.__valid_book_list:
+            print(" >> Watch failed. Book name not found.")
+            return True
+        book_list = self.__valid_book_list if book_name == "all" else [book_name]
+        status_file = status_file if status_file is not None else os.path.join(self.__save_path, "watch_status.json")
+        status = {"account": self.__account_name, "pid": os.getpid(), "state": "grasping", "started": int(time.time()),
+                  "last_poll": None, "last_success": None, "last_change": None, "failures": 0, "next_poll": None,
+                  "problems_grasped": 0}
+        writeAtomically(status_file, json.dumps(status, indent=2))
+
+        self.__incremental_mode = True  # the cursor tells what is new since last poll
+        self.graspAllProblems(book_name)
+
+        etag, delay = None, interval
+        try:
+            while True:
+                status["next_poll"] = int(time.time() + delay)
+                status["state"] = "idle" if status["failures"] == 0 else "backoff"
+                writeAtomically(status_file, json.dumps(status, indent=2))
+                time.sleep(delay)
+
+                status["last_poll"] = int(time.time())
+                # each poll has a retry budget of its own, or a process running for days runs out of it
+                self.__requester.retry_policy.refill()
+                if self.__asset_requester is not None:
+                    self.__asset_requester.retry_policy.refill()
+                try:
+                    changed, new_etag, newest_id = self.__pollNewSubmission(etag, book_list)
+                    if changed:
+                        # the new ETag would answer 304 even if the grasp fails, kept only after the cursor moved
+                        etag = None
+                        status["state"] = "grasping"
+                        writeAtomically(status_file, json.dumps(status, indent=2))
+                        status["problems_grasped"] = status["problems_grasped"] + self.__graspNewSubmissions(book_name, book_list)
+                        status["last_change"] = int(time.time())
+                        cursor = self.__getCursor(book_list)
+                        if cursor is None or int(cursor["submission_id"]) < int(newest_id):
+                            raise RequestError("Grasp of new AC submissions failed.")
+                    etag = new_etag
+                    status["last_success"] = status["last_poll"]
+                    status["failures"] = 0
+                    delay = interval
+                except AuthExpiredError as error:
+                    print(" >> Watch stopped. Session expired. {:s}".format(str(error)))
+                    status["state"] = "expired"
+                    return False
+                except RequestError as error:
+                    status["failures"] = status["failures"] + 1
+                    delay = min(max_interval, interval * 2 ** status["failures"])
+                    print(" >> Poll failed, retry in {:.0f} seconds. {:s}".format(delay, str(error)))
+        finally:
+            if status["state"] != "expired":
+                status["state"] = "stopped"
+            writeAtomically(status_file, json.dumps(status, indent=2))
+
+
+    def __pollNewSubmission(self, etag, book_list):
+        """
+        Check the newest submission of the account against the sync cursor, with a one-entry page.
+        Return whether there are new submissions, the ETag for the next conditional poll, and the newest submission id.
+        """
+        headers = {"If-None-Match": etag} if etag is not None else {}
+        response = self.__requester.request("GET", self.__submissions_api_url, operation="poll", verify=False,
+                                            params={"offset": 0, "limit": 1, "lastkey": ""}, headers=headers)
+        if response.status_code == 304:  # nothing changed since last poll
+            return False, etag, None
+
+        submissions = parseJSON(response)["submissions_dump"]
+        cursor = self.__getCursor(book_list)
+        changed = len(submissions) > 0 and (cursor is None or int(submissions[0]["id"]) > int(cursor["submission_id"]))
+        return changed, response.headers.get("ETag"), str(submissions[0]["id"]) if changed else None
+
 
+    def __graspNewSubmissions(self, book_name, book_list):
+        """
+        Grasp the problems with AC submissions since the sync cursor, and update their summaries.
+        Book lists are fetched only for the problems not in the manifest yet.
+        Return the number of problems grasped.
+        """
+        new_submissions, newest_submission = self.__getNewACSubmissions(book_list)
+        if new_submissions is None:  # not synced yet
+            report = self.graspAllProblems(book_name)
+            return report["problems_done"] if report is not None else 0
+
+        problems_info, unknown_slugs = [], set()
+        for slug, submission in new_submissions.items():
+            rows = [row for row in self.__manifest.getProblemsBySlug(slug) if row["book"] in book_list]
+            if len(rows) == 0:
+                unknown_slugs.add(slug)
+                continue
+            problems_info.append({"title": rows[0]["title"] or slug, "url": slug, "grasped": False, "submission": submission,
+                                  "targets": [{"book": row["book"], "qid": row["qid"]} for row in rows]})
+
+        failed_count = 0
+        if len(unknown_slugs) > 0:  # first AC of a problem
+            listed_problems, fetched_books = self.__getProblemsLists(book_list)
+            failed_count = len(book_list) - len(fetched_books)
+            for problem_info in listed_problems:
+                if problem_info["url"] in unknown_slugs:
+                    problem_info["submission"] = new_submissions[problem_info["url"]]
+                    problems_info.append(problem_info)
+
+        self.__processing_idx = 0
+        self.__processing_total = len(problems_info)
+        self.__graspProblems(problems_info, None)
+        failed_count = failed_count + len([problem_info for problem_info in problems_info if not problem_info["grasped"]])
+        failed_count = failed_count + self.__writer.flush()  # summaries are generated from the manifest
+        for book in sorted(set(target["book"] for problem_info in problems_info for target in problem_info["targets"])):
+            self.__generateListFile(book)
+        self.__storage.commit()
+
+        if failed_count == 0 and newest_submission is not None:
+            self.__manifest.setCursor(self.__cursorKey(book_list), newest_submission["id"], newest_submission["timestamp"])
+        if len(problems_info) > 0:
+            print(" >> Grasp {:d} problems with new AC submissions, {:d} failed.".format(len(problems_info), failed_count))
+            self.__writeRunReport()
+        return len(problems_info) - failed_count
+
+
+    def __graspAllProblems(self, book_name):
         if book_name == "all":  # grasp all the books in the list
             print(" >> All books will be grasped.")
-            for book in self.__valid_book_list:
-                self.graspAllProblems(book)
-            return
+            book_list = self.__valid_book_list
         elif book_name in self.__valid_book_list:
-            self.__book_name = book_name
+            book_list = [book_name]
         else:
             print(" >> Grasp failed. Book name not found.")
             return
 
-        self.__getProblemsList()
-        length = len(self.__problems_info)
+        try:
+            new_submissions, newest_submission = None, None
+            if self.__incremental_mode:
+                try:
+                    new_submissions, newest_submission = self.__getNewACSubmissions(book_list)
+                except AuthExpiredError:
+                    raise
+                except RequestError as error:
+                    print(" >> Get submissions since last sync failed. All the problems will be checked. {:s}".format(str(error)))
+
+            problems_info, fetched_books = self.__getProblemsLists(book_list)
+            failed_count = len(book_list) - len(fetched_books)
+            failed_count = failed_count + self.__graspProblemsOfBooks(book_name, problems_info, new_submissions)
+        except AuthExpiredError as error:
+            print(" >> Grasp stopped. Session expired, please login again. {:s}".format(str(error)))
+            return
+
+        failed_count = failed_count + self.__writer.flush()  # summaries are generated from the manifest
+        for book in fetched_books:
+            self.__generateListFile(book)
+            print(" >> Grasp BOOK [{:s}] finished.".format(book))
+
+        if newest_submission is not None:
+            if failed_count == 0:
+                self.__manifest.setCursor(self.__cursorKey(book_list), newest_submission["id"], newest_submission["timestamp"])
+                print(" >> Sync cursor moved to submission [{:s}].".format(newest_submission["id"]))
+            else:
+                print(" >> {:d} problems grasp failed, sync cursor is not moved.".format(failed_count))
+
+
+    def __graspProblemsOfBooks(self, book_name, problems_info, new_submissions):
+        """
+        Grasp the merged AC problems of the books. Return the number of problems failed.
+        In incremental mode, new_submissions maps slugs to their AC submissions since last sync.
+        """
+        length = len(problems_info)
         if length == 0:
             print(" >> No AC submissions found.")
-            print(" >> Grasp BOOK [{:s}] finished.".format(self.__book_name))
-            return
+            return 0
 
         print(" >> Start grasping.")
-        if self.__debug_mode:  # not use tqdm
-            idx = 1
-            for problem_info in self.__problems_info:
-                # Skip grasping this problem if found
-                if not self.__force_mode:
-                    file_path = os.path.join(self.__save_path, self.__book_name, problem_info["qid"])
-                    check_file_paths = glob.glob("{:s} - *".format(file_path))
-                    check_existed = len(check_file_paths)
-                    if check_existed != 0:
-                        # get translated_title and save to problem info
-                        title_start_idx = check_file_paths[0].find("{:s} - ".format(file_path)) + len(file_path) + 3
-                        problem_info["translated_title"] = check_file_paths[0][title_start_idx:]
-                        problem_info["grasped"] = True
+        pending_problems = []
+        for problem_info in problems_info:
+            if new_submissions is not None and problem_info["url"] in new_submissions:
+                problem_info["submission"] = new_submissions[problem_info["url"]]  # newer AC since last sync
+            elif not self.__force_mode:
+                # Skip grasping this problem in the books where it is found
+                problem_info["targets"] = [target for target in problem_info["targets"]
+                                           if not self.__checkProblemGrasped(target, problem_info)]
+                if len(problem_info["targets"]) == 0:
+                    problem_info["grasped"] = True
+                    if self.__debug_mode:
                         print(" >> Problem [{:s}] has been grasped, skip it.".format(problem_info["title"]))
-                        continue
-
-                print(" >> Processing problem [{:s} - {:s}]. ({:d}/{:d})"
-                        .format(problem_info["qid"], problem_info["title"], idx, length))
-                idx = idx + 1
-
-                status_ok = self.__getLatestACSubmission(problem_info)
-                if not status_ok:
-                    print(" >> Problem [{:s}] grasp failed, skip it.".format(problem_info["title"]))
                     continue
-                self.__getProblemDiscription(problem_info)
-                problem_info["grasped"] = True
+            pending_problems.append(problem_info)
+
+        self.__processing_idx = 0
+        self.__processing_total = length
+        if self.__debug_mode:  # not use tqdm
+            self.__graspProblems(pending_problems, None)
         else:
-            tqdm_desc = "BOOK {:s}".format(self.__book_name)
-            with tqdm(total=len(self.__problems_info), ncols=80, desc=tqdm_desc, 
+            tqdm_desc = "BOOK {:s}".format(book_name)
+            if self.__executor is not None:  # bars of several accounts at the same time
+                tqdm_desc = "{:s} {:s}".format(self.__account_name, tqdm_desc)
+            with tqdm(total=length, ncols=80, desc=tqdm_desc, 
                     bar_format=" >> {l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}{postfix}]") as pbar:
-                for problem_info in self.__problems_info:
-                    # Skip grasping this problem if found
-                    if not self.__force_mode:
-                        file_path = os.path.join(self.__save_path, self.__book_name, problem_info["qid"])
-                        check_file_paths = glob.glob("{:s} - *".format(file_path))
-                        check_existed = len(check_file_paths)
-                        if check_existed != 0:
-                            # get translated_title and save to problem info
-                            title_start_idx = check_file_paths[0].find("{:s} - ".format(file_path)) + len(file_path) + 3
-                            problem_info["translated_title"] = check_file_paths[0][title_start_idx:]
-                            problem_info["grasped"] = True
-                            pbar.update(1)
-                            continue
-
-                    status_ok = self.__getLatestACSubmission(problem_info)
-                    if not status_ok:
-                        print(" >> Problem [{:s}] grasp failed, skip it.".format(problem_info["title"]))
-                        pbar.update(1)
-                        continue
-                    self.__getProblemDiscription(problem_info)
-                    problem_info["grasped"] = True
-                    pbar.update(1)
+                pbar.update(length - len(pending_problems))  # skipped problems
+                self.__graspProblems(pending_problems, pbar)
+
+        return len([problem_info for problem_info in pending_problems if not problem_info["grasped"]])
 
-        self.__generateListFile(book_name)
 
-        print(" >> Grasp BOOK [{:s}] finished.".format(self.__book_name))
+    def __graspProblems(self, problems_info, pbar):
+        """
+        Grasp problems in batches, one batch by one, or with a thread pool if workers > 1
+        (the pool shared by the team when crawling for several accounts)
+        """
+        batches = [problems_info[idx:idx+self.__batch_size] for idx in range(0, len(problems_info), self.__batch_size)]
+        if self.__workers == 1 and self.__executor is None:
+            for batch in batches:
+                self.__graspProblemsBatch(batch)
+                if pbar is not None:
+                    pbar.update(len(batch))
+                    pbar.set_postfix_str(self.__metrics.rateString())
+            return
 
+        executor = self.__executor if self.__executor is not None else ThreadPoolExecutor(max_workers=self.__workers)
+        futures = {}
+        try:
+            futures = {executor.submit(self.__graspProblemsBatch, batch): len(batch) for batch in batches}
+            for future in as_completed(futures):
+                future.result()  # raise the exception from worker if any
+                if pbar is not None:
+                    pbar.update(futures[future])
+                    pbar.set_postfix_str(self.__metrics.rateString())
+        finally:
+            for future in futures:  # not run the rest after an error
+                future.cancel()
+            if executor is not self.__executor:  # the pool of team is shut down by the team
+                executor.shutdown()
+
+
+    def __graspProblemsBatch(self, problems_info):
+        if self.__debug_mode:
+            with self.__print_lock:
+                for problem_info in problems_info:
+                    self.__processing_idx = self.__processing_idx + 1
+                    print(" >> Processing problem [{:s} - {:s}]. ({:d}/{:d})"
+                            .format(problem_info["targets"][0]["qid"], problem_info["title"], self.__processing_idx, self.__processing_total))
+
+        # submission lists are queried one by one (unless known from incremental sync),
+        # details and descriptions in batch
+        submitted_problems = []
+        for problem_info in problems_info:
+            try:
+                if "submission" in problem_info or self.__getLatestACSubmission(problem_info):
+                    submitted_problems.append(problem_info)
+            except AuthExpiredError:
+                raise
+            except RequestError as error:
+                print(" >> Get problem [{:s}] submissions error. {:s}".format(problem_info["title"], str(error)))
+
+        try:
+            coded_problems = self.__getSubmissionDetails(submitted_problems)
+            described_problems = self.__getProblemDiscriptions(coded_problems)
+        except AuthExpiredError:
+            raise
+        except RequestError as error:
+            print(" >> Query batch error. {:s}".format(str(error)))
+            described_problems = []
+
+        for problem_info in described_problems:
+            problem_info["grasped"] = True
+            if self.__history_mode:
+                try:
+                    self.__graspSubmissionHistory(problem_info)
+                except AuthExpiredError:
+                    raise
+                except RequestError as error:
+                    print(" >> Get problem [{:s}] submission history error. {:s}".format(problem_info["title"], str(error)))
+
+        failed_count = 0
+        for problem_info in problems_info:
+            if not problem_info["grasped"]:
+                print(" >> Problem [{:s}] grasp failed, skip it.".format(problem_info["title"]))
+                failed_count = failed_count + 1
+        self.__metrics.problemsDone(len(problems_info) - failed_count, failed_count)
+
+
+    def __checkProblemGrasped(self, target, problem_info):
+        manifest_info = self.__manifest.getProblem(target["book"], target["qid"])
+        if manifest_info is None or manifest_info["problem_file"] is None or manifest_info["code_file"] is None:
+            return False
+        # files of the tree are recorded after renamed in place, only an archive may lose the uncommitted ones
+        if self.__output_format != "tree" and \
+                (not self.__storage.exists(os.path.join(target["book"], manifest_info["problem_file"])) or
+                 not self.__storage.exists(os.path.join(target["book"], manifest_info["code_file"]))):
+            return False
+        if self.__history_mode and (manifest_info["history_id"] is None or
+                                    manifest_info["history_filter"] != self.__history_filter):  # never archived with these filters
+            return False
 
-    def __getProblemsList(self):
-        html = self.__client.get(self.__problem_list_url + self.__book_name + "/", verify=False)
-        html = json.loads(html.text)
+        if manifest_info["slug"] is None:  # rebuilt from the tree, fill the missing fields
+            self.__manifest.update(target["book"], target["qid"], slug=problem_info["url"], title=problem_info["title"])
+        return True
+
+
+    def __getProblemsLists(self, book_list):
+        """
+        Get the lists of books together, merge the problems found in several books
+        Return the merged problems, and the books whose list is fetched.
+        """
+        with ThreadPoolExecutor(max_workers=len(book_list)) as executor:
+            futures = {book: executor.submit(self.__getProblemsList, book) for book in book_list}
+
+        problems_info = {}  # slug -> { title, url, targets: [{ book, qid }], grasped,
+                            #          submission(if AC found), translated_title(if grasped) }
+        fetched_books = []
+        for book in book_list:
+            try:
+                book_problems = futures[book].result()
+            except AuthExpiredError:
+                raise
+            except RequestError as error:
+                print(" >> Get BOOK [{:s}] list failed, skip it. {:s}".format(book, str(error)))
+                continue
+            fetched_books.append(book)
+
+            for problem in book_problems:
+                problem_info = problems_info.setdefault(problem["url"], {"title": problem["title"],
+                                                                         "url": problem["url"],
+                                                                         "targets": [],
+                                                                         "grasped": False})
+                problem_info["targets"].append({"book": book, "qid": problem["qid"]})
+
+        if len(fetched_books) > 1:
+            print(" >> Collect {:d} different problems in {:d} books.".format(len(problems_info), len(fetched_books)))
+        return list(problems_info.values()), fetched_books
+
+
+    def __getProblemsList(self, book_name):
+        html = self.__getJSON(self.__problem_list_url + book_name + "/", "problems")
         problems_origin = html["stat_status_pairs"]
 
-        self.__problems_info = []  # reset
+        problems_info = []
         for problem in problems_origin:
             if problem["status"] == "ac":  # only collect AC problems
-                self.__problems_info.append({"qid": problem["stat"]["frontend_question_id"],
-                                             "title": problem["stat"]["question__title"],
-                                             "url": problem["stat"]["question__title_slug"],
-                                             "grasped": False})
+                problems_info.append({"qid": problem["stat"]["frontend_question_id"],
+                                      "title": problem["stat"]["question__title"],
+                                      "url": problem["stat"]["question__title_slug"]})
 
-        print(" >> Get BOOK [{:s}] list successfully. Collect {:d} problems.".format(self.__book_name, len(self.__problems_info)))
+        with self.__print_lock:
+            print(" >> Get BOOK [{:s}] list successfully. Collect {:d} problems.".format(book_name, len(problems_info)))
+        return problems_info
 
 
-    def __getProblemDiscription(self, problem_info):
-        this_problem_url = self.__problem_url + problem_info["url"] + "/"
-        headers = self.__postHTTPJSONHeader(Referer=this_problem_url)
+    def __getNewACSubmissions(self, book_list):
+        """
+        Page through the submissions of the account until reaching the sync cursor of the books
+        Return the latest AC submission of each problem since the cursor (None if no cursor yet),
+        and the newest submission seen.
+        """
+        cursor = self.__getCursor(book_list)
+        new_submissions = {}
+        newest_submission = None
+        offset, last_key, page_size = 0, "", 20
+
+        while True:
+            page = self.__getJSON(self.__submissions_api_url, "api_submissions",
+                                  params={"offset": offset, "limit": page_size, "lastkey": last_key})
+
+            cursor_reached = False
+            for submission in page["submissions_dump"]:  # default have time order
+                if newest_submission is None:
+                    newest_submission = {"id": str(submission["id"]), "timestamp": int(submission["timestamp"])}
+                if cursor is None or int(submission["id"]) <= int(cursor["submission_id"]):
+                    cursor_reached = True
+                    break
+                if submission["status_display"] == "Accepted" and submission["title_slug"] not in new_submissions:
+                    new_submissions[submission["title_slug"]] = {"id": str(submission["id"]),
+                                                                 "lang": submission["lang"],
+                                                                 "url": submission["url"],
+                                                                 "timestamp": int(submission["timestamp"])}
+            if cursor_reached or not page["has_next"]:
+                break
+            offset = offset + page_size
+            last_key = page["last_key"]
 
-        json_query = "query questionData($titleSlug: String!) {\n  question(titleSlug: $titleSlug) {\n    questionId\n    questionFrontendId\n    categoryTitle\n    title\n    titleSlug\n    translatedTitle\n    translatedContent\n    difficulty\n    status\n  }\n}\n"
-        if self.__debug_mode:  # grasp all the content in debug mode
-            json_query = "query questionData($titleSlug: String!) {\n  question(titleSlug: $titleSlug) {\n    questionId\n    questionFrontendId\n    categoryTitle\n    boundTopicId\n    title\n    titleSlug\n    content\n    translatedTitle\n    translatedContent\n    isPaidOnly\n    difficulty\n    likes\n    dislikes\n    isLiked\n    similarQuestions\n    contributors {\n      username\n      profileUrl\n      avatarUrl\n      __typename\n    }\n    langToValidPlayground\n    topicTags {\n      name\n      slug\n      translatedName\n      __typename\n    }\n    companyTagStats\n    codeSnippets {\n      lang\n      langSlug\n      code\n      __typename\n    }\n    stats\n    hints\n    solution {\n      id\n      canSeeDetail\n      __typename\n    }\n    status\n    sampleTestCase\n    metaData\n    judgerAvailable\n    judgeType\n    mysqlSchemas\n    enableRunCode\n    envInfo\n    book {\n      id\n      bookName\n      pressName\n      source\n      shortDescription\n      fullDescription\n      bookImgUrl\n      pressImgUrl\n      productUrl\n      __typename\n    }\n    isSubscribed\n    isDailyQuestion\n    dailyRecordStatus\n    editorType\n    ugcQuestionId\n    style\n    exampleTestcases\n    __typename\n  }\n}\n"
-        param = self.__postHTTPJSONParam("questionData", {"titleSlug": problem_info["url"]}, json_query)
+        if cursor is None:
+            print(" >> No sync cursor found. All the problems will be checked this time.")
+            return None, newest_submission
+        print(" >> Found {:d} problems with new AC submissions since last sync.".format(len(new_submissions)))
+        return new_submissions, newest_submission
 
-        param_json = json.dumps(param).encode("utf-8")
-        response = self.__client.post(self.__query_url, data=param_json, headers=headers)
-        problem_details = response.json()["data"]["question"]
-        difficulty = problem_details["difficulty"]
 
-        translated_title = problem_details["translatedTitle"]
-        problem_info["translated_title"] = translated_title  # save to problem info
-        problem_name = "{:s} - {:s}".format(problem_info["qid"], translated_title)
-        file_path = os.path.join(self.__save_path, self.__book_name, problem_name)
-        utils.saveProblemFile(file_path, translated_title, problem_name, difficulty, problem_details["translatedContent"])
+    def __cursorKey(self, book_list):
+        """
+        Sync cursors are kept for each account and set of books, the submissions of the other books
+        are not stepped over by a run of some books
+        """
+        if set(book_list) == set(self.__valid_book_list):
+            return self.__account_name  # same key as the cursors of older version
+        return "{:s}/{:s}".format(self.__account_name, ",".join(sorted(book_list)))
 
-        if self.__debug_mode:
-            print(" >> Get problem [{:s}] discription.".format(problem_info["title"]))
-        return True
+
+    def __getCursor(self, book_list):
+        """
+        Return the sync cursor of the books, the one of all the books is also good for the first run of some of them
+        """
+        cursor = self.__manifest.getCursor(self.__cursorKey(book_list))
+        if cursor is None:
+            cursor = self.__manifest.getCursor(self.__account_name)
+        return cursor
+
+
+    def __getProblemDiscriptions(self, problems_info):
+        """
+        Get and save the descriptions of problems with one batch query
+        Return the problems saved successfully
+        """
+        if len(problems_info) == 0:
+            return []
+        this_problem_url = self.__problem_url + problems_info[0]["url"] + "/"
+
+        json_fields = queries.QUESTION_FIELDS[self.__fields]
+
+        slugs = [problem_info["url"] for problem_info in problems_info]
+        results = self.__postCachedBatchQuery("questionData", "question", "titleSlug", "String!", slugs, json_fields,
+                                              this_problem_url, self.__problem_retry_times)
+
+        if self.__assets is not None:  # download the images of the whole batch together
+            self.__assets.prefetch([problem_details["translatedContent"] for problem_details in results if problem_details != None])
+
+        saved_problems = []
+        for problem_info, problem_details in zip(problems_info, results):
+            if problem_details == None:
+                print(" >> Get problem [{:s}] discription error.".format(problem_info["title"]))
+                continue
+            difficulty = problem_details["difficulty"]
+            tags = [tag["translatedName"] or tag.get("name") for tag in problem_details.get("topicTags") or []]
+
+            translated_title = problem_details["translatedTitle"]
+            problem_info["translated_title"] = translated_title  # save to problem info
+            for target in problem_info["targets"]:  # write to every book needs it
+                problem_name = "{:s} - {:s}".format(target["qid"], translated_title)
+                file_path = os.path.join(target["book"], problem_name)
+                content = problem_details["translatedContent"]
+                if self.__assets is not None:
+                    content = self.__assets.localize(content, file_path)
+                problem_file = translated_title + ".html"
+                # recorded in manifest only after written
+                self.__writer.write(os.path.join(file_path, problem_file), utils.renderProblemFile(problem_name, difficulty, content),
+                                    kind="problem_file", then=functools.partial(self.__manifest.update, target["book"], target["qid"],
+                                        slug=problem_info["url"], title=problem_info["title"], translated_title=translated_title,
+                                        difficulty=difficulty, tags=json.dumps(tags, ensure_ascii=False),
+                                        problem_file=os.path.join(problem_name, problem_file)))
+                if self.__fields != "minimal":  # metadata not shown in the pages
+                    sidecar = {"question": queries.extraFields(problem_details, queries.QUESTION_USED_FIELDS),
+                               "submission": problem_info.get("submission_extra", {})}
+                    self.__writer.write(os.path.join(file_path, translated_title + ".json"),
+                                        [json.dumps(sidecar, indent=2, ensure_ascii=False)], kind="sidecar_file")
+            saved_problems.append(problem_info)
+
+            if self.__debug_mode:
+                print(" >> Get problem [{:s}] discription.".format(problem_info["title"]))
+        return saved_problems
 
 
     def __getLatestACSubmission(self, problem_info):
-        this_problem_url = self.__problem_url + problem_info["url"] + "submissions/"
-        headers = self.__postHTTPJSONHeader(Referer=this_problem_url)
+        """
+        Find the latest AC submission of a problem, save it to problem info
+        """
+        for submission in self.__iterSubmissions(problem_info):  # default have time order
+            if submission["statusDisplay"] == "Accepted":  # AC
+                # save latest submission id, then we can get the code
+                problem_info["submission"] = {"id": submission["id"], "lang": submission["lang"],
+                                              "url": submission["url"], "timestamp": int(submission["timestamp"])}
+                return True
+
+        print(" >> No accepted soulution found. Skip this problem")
+        return False
 
-        json_query = "query submissions($offset: Int!, $limit: Int!, $lastKey: String, $questionSlug: String!, $markedOnly: Boolean, $lang: String) {\n  submissionList(offset: $offset, limit: $limit, lastKey: $lastKey, questionSlug: $questionSlug, markedOnly: $markedOnly, lang: $lang) {\n    lastKey\n    submissions {\n      id\n      statusDisplay\n      lang\n      timestamp\n      url\n    }\n  }\n}\n"
-        if self.__debug_mode:  # grasp all the content in debug mode
-            json_query = "query submissions($offset: Int!, $limit: Int!, $lastKey: String, $questionSlug: String!, $markedOnly: Boolean, $lang: String) {\n  submissionList(offset: $offset, limit: $limit, lastKey: $lastKey, questionSlug: $questionSlug, markedOnly: $markedOnly, lang: $lang) {\n    lastKey\n    hasNext\n    submissions {\n      id\n      statusDisplay\n      lang\n      runtime\n      timestamp\n      url\n      isPending\n      memory\n      submissionComment {\n        comment\n        flagType\n        __typename\n      }\n      __typename\n    }\n    __typename\n  }\n}\n"
-        param = self.__postHTTPJSONParam("submissions", {"offset":0, "limit":50, "lastKey":"null", "questionSlug": problem_info["url"]}, json_query)
 
-        param_json = json.dumps(param).encode("utf-8")
-        response = self.__client.post(self.__query_url, data=param_json, headers=headers)
-        submission_details = response.json()["data"]["submissionList"]["submissions"]
+    def __iterSubmissions(self, problem_info, lang=None, page_size=50):
+        """
+        Generate the submissions of a problem from newest to oldest, one page in memory at a time
+        """
+        this_problem_url = self.__problem_url + problem_info["url"] + "submissions/"
 
-        submission_idx = -1
-        for idx in range(len(submission_details)):  # default have time order
-            if submission_details[idx]["statusDisplay"] == "Accepted":  # AC
-                submission_idx = idx
-                break
-        if submission_idx == -1:
-            print(" >> No accepted soulution found. Skip this problem")
-            return False
+        json_query = queries.submissionListQuery(self.__fields)
 
+        offset, last_key = 0, "null"
+        while True:
+            variables = {"offset": offset, "limit": page_size, "lastKey": last_key, "questionSlug": problem_info["url"]}
+            if lang is not None:
+                variables["lang"] = lang
+            param = self.__postHTTPJSONParam("submissions", variables, json_query)
+            submission_list = self.__postGraphQL(param, this_problem_url)["submissionList"]
 
-        # get latest submission id, then we can get the code
-        lang = submission_details[submission_idx]["lang"]
-        latest_submission_id = submission_details[submission_idx]["id"]
-        latest_submission_url = submission_details[submission_idx]["url"][1:]  # remove '/'
-        latest_submission_url = self.__leetcode_url + latest_submission_url
-        headers = self.__postHTTPJSONHeader(Referer=latest_submission_url)
-
-        json_query = "query mySubmissionDetail($id: ID!) {\n  submissionDetail(submissionId: $id) {\n    id\n    code\n    lang\n    question {\n      translatedTitle\n    }\n  }\n}\n"
-        if self.__debug_mode:  # grasp all the content in debug mode
-            json_query = "query mySubmissionDetail($id: ID!) {\n  submissionDetail(submissionId: $id) {\n    id\n    code\n    runtime\n    memory\n    rawMemory\n    statusDisplay\n    timestamp\n    lang\n    passedTestCaseCnt\n    totalTestCaseCnt\n    sourceUrl\n    question {\n      titleSlug\n      title\n      translatedTitle\n      questionId\n      __typename\n    }\n    ... on GeneralSubmissionNode {\n      outputDetail {\n        codeOutput\n        expectedOutput\n        input\n        compileError\n        runtimeError\n        lastTestcase\n        __typename\n      }\n      __typename\n    }\n    submissionComment {\n      comment\n      flagType\n      __typename\n    }\n    __typename\n  }\n}\n"
-        param = self.__postHTTPJSONParam("mySubmissionDetail", {"id": latest_submission_id}, json_query)
-
-        # Post this query may be failed, so it will retry
-        retry_times = self.__submission_retry_times
-        while retry_times > 0:
-            param_json = json.dumps(param).encode("utf-8")
-            response = self.__client.post(self.__query_url, data=param_json, headers=headers)
-            code_details = response.json()["data"]["submissionDetail"]
-            if code_details != None:
-                break
-            else:
-                if retry_times == self.__submission_retry_times - 2:  # only hint once
-                    print(" >> Get submission error. Retrying...")
-                retry_times = retry_times - 1
-                time.sleep(3.0)  # wait and retry
+            for submission in submission_list["submissions"]:
+                yield submission
+            if not submission_list.get("hasNext") or submission_list.get("lastKey") is None \
+                    or len(submission_list["submissions"]) == 0:
+                return
+            offset, last_key = offset + page_size, submission_list["lastKey"]
 
-        if code_details == None:
-            print(" >> Get submission error.")
-            return False
 
-        file_name = code_details["question"]["translatedTitle"]
-        problem_name = "{:s} - {:s}".format(problem_info["qid"], file_name)
-        file_path = os.path.join(self.__save_path, self.__book_name, problem_name)
-        code_content = code_details["code"]
-        utils.saveCodeFile(file_path, file_name, lang, code_details["code"])
+    def __graspSubmissionHistory(self, problem_info):
+        """
+        Save the submissions of a problem selected by language and status, one file per (language, submission),
+        to the history folder of the problem. Only the submissions newer than last archived with the same filters are walked.
+        """
+        stop_id = None
+        if not self.__force_mode:
+            manifest_infos = [self.__manifest.getProblem(target["book"], target["qid"]) or {}
+                              for target in problem_info["targets"]]
+            if all(manifest_info.get("history_id") is not None and manifest_info.get("history_filter") == self.__history_filter
+                   for manifest_info in manifest_infos):
+                stop_id = min(int(manifest_info["history_id"]) for manifest_info in manifest_infos)
+
+        lang = next(iter(self.__history_langs)) if self.__history_langs is not None and len(self.__history_langs) == 1 else None
+        newest_id, failed_count, pending_submissions = None, 0, []
+        for submission in self.__iterSubmissions(problem_info, lang=lang):
+            if newest_id is None:
+                newest_id = str(submission["id"])
+            if stop_id is not None and int(submission["id"]) <= stop_id:
+                break  # archived by last run
+            if self.__history_langs is not None and submission["lang"] not in self.__history_langs:
+                continue
+            if self.__history_status != "all" and submission["statusDisplay"] != self.__history_status:
+                continue
+            pending_submissions.append(submission)
+            if len(pending_submissions) >= self.__batch_size:  # keep at most one batch in memory
+                failed_count = failed_count + self.__saveHistorySubmissions(problem_info, pending_submissions)
+                pending_submissions = []
+        if len(pending_submissions) > 0:
+            failed_count = failed_count + self.__saveHistorySubmissions(problem_info, pending_submissions)
+
+        if failed_count > 0:  # walk again next time
+            print(" >> Problem [{:s}] {:d} history submissions failed.".format(problem_info["title"], failed_count))
+        elif newest_id is not None:
+            for target in problem_info["targets"]:  # after the history files written
+                self.__writer.call(functools.partial(self.__manifest.update, target["book"], target["qid"],
+                                                     history_id=newest_id, history_filter=self.__history_filter))
+
+
+    def __saveHistorySubmissions(self, problem_info, submissions):
+        """
+        Get the code of several history submissions with one batch query, return the number failed
+        """
+        submission_url = self.__leetcode_url + submissions[0]["url"][1:]  # remove '/'
+        results = self.__postBatchQuery("mySubmissionDetail", "submissionDetail", "submissionId", "ID!",
+                                        [submission["id"] for submission in submissions], queries.SUBMISSION_DETAIL_FIELDS[self.__fields],
+                                        submission_url, self.__submission_retry_times)
+
+        failed_count = 0
+        for submission, code_details in zip(submissions, results):
+            if code_details == None:
+                failed_count = failed_count + 1
+                continue
+            for target in problem_info["targets"]:
+                problem_name = "{:s} - {:s}".format(target["qid"], problem_info["translated_title"])
+                file_path = os.path.join(target["book"], problem_name, "history", submission["lang"])
+                self.__writer.write(os.path.join(file_path, utils.codeFileName(str(submission["id"]), submission["lang"])),
+                                    [code_details["code"]], kind="history_file")
+        return failed_count
+
+
+    def __getSubmissionDetails(self, problems_info):
+        """
+        Get and save the code of the latest AC submissions with one batch query
+        Return the problems saved successfully
+        """
+        if len(problems_info) == 0:
+            return []
+        latest_submission_url = self.__leetcode_url + problems_info[0]["submission"]["url"][1:]  # remove '/'
+
+        # Post this query may be failed, so the failed entries will retry
+        submission_ids = [problem_info["submission"]["id"] for problem_info in problems_info]
+        results = self.__postBatchQuery("mySubmissionDetail", "submissionDetail", "submissionId", "ID!", submission_ids,
+                                        queries.SUBMISSION_DETAIL_FIELDS[self.__fields],
+                                        latest_submission_url, self.__submission_retry_times)
+
+        saved_problems = []
+        for problem_info, code_details in zip(problems_info, results):
+            if code_details == None:
+                print(" >> Get submission error.")
+                continue
+
+            file_name = code_details["question"]["translatedTitle"]
+            if self.__fields != "minimal":  # saved with the question metadata
+                problem_info["submission_extra"] = queries.extraFields(code_details, queries.SUBMISSION_USED_FIELDS)
+            for target in problem_info["targets"]:  # write to every book needs it
+                problem_name = "{:s} - {:s}".format(target["qid"], file_name)
+                file_path = os.path.join(target["book"], problem_name)
+                code_file = utils.codeFileName(file_name, problem_info["submission"]["lang"])
+                self.__writer.write(os.path.join(file_path, code_file), [code_details["code"]],
+                                    kind="code_file", then=functools.partial(self.__replaceCodeFile, target["book"], target["qid"],
+                                        slug=problem_info["url"], title=problem_info["title"],
+                                        translated_title=file_name, lang=problem_info["submission"]["lang"],
+                                        submission_id=str(problem_info["submission"]["id"]),
+                                        timestamp=problem_info["submission"]["timestamp"],
+                                        code_file=os.path.join(problem_name, code_file)))
+            saved_problems.append(problem_info)
+
+            if self.__debug_mode:
+                print(" >> Get problem [{:s}] latest AC submission.".format(problem_info["title"]))
+        return saved_problems
+
+
+    def __replaceCodeFile(self, book_name, qid, **fields):
+        """
+        Record the new code file of a problem in manifest, and remove the old one if its name changed,
+        e.g. the latest AC submission is in another language. Called after the new file is written.
+        """
+        manifest_info = self.__manifest.getProblem(book_name, qid)
+        self.__manifest.update(book_name, qid, **fields)
+        if manifest_info is not None and manifest_info["code_file"] not in (None, fields["code_file"]):
+            self.__storage.remove(os.path.join(book_name, manifest_info["code_file"]))
 
-        if self.__debug_mode:
-            print(" >> Get problem [{:s}] latest AC submission.".format(problem_info["title"]))
-        return True
+
+    def __postCachedBatchQuery(self, operation_name, field_name, arg_name, arg_type, values, fields, referer, retry_times):
+        """
+        Same as __postBatchQuery, but the entries found in response cache are not queried
+        """
+        if self.__cache is None:
+            return self.__postBatchQuery(operation_name, field_name, arg_name, arg_type, values, fields, referer, retry_times)
+
+        results = [self.__cache.get(operation_name, {arg_name: value}, fields) for value in values]
+        missed_idx = [idx for idx in range(len(values)) if results[idx] == None]
+        if len(missed_idx) == 0:
+            return results
+
+        with self.__cache.locking(operation_name, [{arg_name: values[idx]} for idx in missed_idx], fields):
+            for idx in missed_idx:  # may be queried by another account while waiting
+                results[idx] = self.__cache.get(operation_name, {arg_name: values[idx]}, fields)
+            missed_idx = [idx for idx in missed_idx if results[idx] == None]
+            if len(missed_idx) > 0:
+                missed_results = self.__postBatchQuery(operation_name, field_name, arg_name, arg_type,
+                                                       [values[idx] for idx in missed_idx], fields, referer, retry_times)
+                for idx, result in zip(missed_idx, missed_results):
+                    results[idx] = result
+                    self.__cache.set(operation_name, {arg_name: values[idx]}, fields, result)
+        return results
+
+
+    def __postBatchQuery(self, operation_name, field_name, arg_name, arg_type, values, fields, referer, retry_times):
+        """
+        Query one field for several values with an aliased GraphQL document,
+        only the entries that came back null are queried again.
+        Return the results in the order of values, None if still failed.
+        """
+        results = [None] * len(values)
+        pending_idx = list(range(len(values)))
+
+        for retry_idx in range(retry_times):
+            if retry_idx > 0:
+                if retry_idx == 2:  # only hint once
+                    print(" >> Get {:s} error. Retrying...".format(operation_name))
+                self.__metrics.observeRetry(operation_name, "NullDataError")
+                if not self.__requester.backoff(retry_idx - 1, operation_name):  # wait and retry
+                    break
+
+            # alias "q{idx}" keeps the index of the value, even when retrying a part of them
+            json_query = "query {:s}({:s}) {{\n".format(operation_name,
+                    ", ".join("$v{:d}: {:s}".format(idx, arg_type) for idx in pending_idx))
+            for idx in pending_idx:
+                json_query += "  q{:d}: {:s}({:s}: $v{:d}) {{\n{:s}  }}\n".format(idx, field_name, arg_name, idx, fields)
+            json_query += "}\n"
+            variables = {"v{:d}".format(idx): values[idx] for idx in pending_idx}
+            param = self.__postHTTPJSONParam(operation_name, variables, json_query)
+
+            data = self.__postGraphQL(param, referer)
+            for idx in pending_idx:
+                results[idx] = data.get("q{:d}".format(idx))
+
+            pending_idx = [idx for idx in pending_idx if results[idx] == None]
+            if len(pending_idx) == 0:
+                break
+        return results
 
 
     def __generateListFile(self, book_name):
-        file_path = os.path.join(self.__save_path, book_name)
         file_name = "题目与题解汇总"
 
-        valid_problems_info = []
-        for problem_info in self.__problems_info:
-            if problem_info["grasped"]:
-                valid_problems_info.append(problem_info)
+        problems_info = self.__manifest.getProblems(book_name)
+        if len(problems_info) == 0:  # no AC problems in this book
+            return
+        digests = utils.saveListFile(self.__storage, book_name, file_name, book_name, problems_info, page_size=self.__page_size,
+                                     old_digests=self.__manifest.getSummaryDigests(book_name), metrics=self.__metrics)
+        self.__manifest.setSummaryDigests(book_name, digests)
+
+
+    def __writeRunReport(self):
+        """
+        Write the JSON run report, and the Prometheus textfile if asked
+        """
+        report = self.__metrics.writeReport(self.__report_file)
+        if self.__prometheus_file is not None:
+            self.__metrics.writePrometheus(self.__prometheus_file)
+        print(" >> {:d} problems grasped, {:d} failed, {:d} requests in {:.1f} seconds. Report saved to {:s}".format(
+              report["problems_done"], report["problems_failed"], report["requests"], report["elapsed"], self.__report_file))
+        return report
+
 
-        utils.saveListFile(file_path, file_name, book_name, valid_problems_info)
+    def __getJSON(self, url, operation, **kwargs):
+        return self.__requester.request("GET", url, parse=parseJSON, operation=operation, verify=False, **kwargs)
+
+
+    def __postGraphQL(self, param, referer):
+        """
+        Post a GraphQL query, return the data of response
+        """
+        headers = self.__postHTTPJSONHeader(Referer=referer)
+        param_json = json.dumps(param).encode("utf-8")
+        return self.__requester.request("POST", self.__query_url, parse=parseGraphQL, operation=param["operationName"],
+                                        data=param_json, headers=headers)
 
 
     def __postHTTPJSONHeader(self, Referer):
-        return {
+        headers = {
             "Connection": "keep-alive",
             "Content-Type": "application/json",
             "Referer": Referer
         }
+        csrf_token = next((cookie.value for cookie in self.__client.cookies if cookie.name == "csrftoken"), None)
+        if csrf_token is not None:
+            headers["x-csrftoken"] = csrf_token
+        return headers
     
     
     def __postHTTPJSONParam(self, operationName, variables, query):
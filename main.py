@@ -2,13 +2,18 @@
 
 import os
 import sys
+import json
+import signal
 import argparse
 import requests
 
 from client import LeetCodeClient
+from storage import OUTPUT_FORMATS, ARCHIVE_FILE_NAMES, exportArchive
+from team import crawlTeam
+from queries import FIELD_PROFILES
 
 
-def parseArgs():
+def parseArgs(argv=None):
     parser = argparse.ArgumentParser(description=" === LeetCode CN Crawler ===",
                                      formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument("-b", "--book", type=str, default="all", 
@@ -21,19 +26,99 @@ def parseArgs():
                                              "  lcci         -- 程序员面试金典 , \n" + 
                                              "  lcof         -- 剑指Offer ]")
     parser.add_argument("-d", "--debug", default=False, action="store_true",
-                        help="debug mode, querying the unecessary content, and may be slower")
+                        help="debug mode, print more logs")
+    parser.add_argument("--fields", type=str, default="minimal", choices=FIELD_PROFILES,
+                        help="fields queried from the server [ minimal(default) -- only the ones written to output , \n" +
+                             "                                  archive -- and metadata like stats, hints and runtime, in <title>.json , \n" +
+                             "                                  full    -- all the fields of the web page, in <title>.json ]")
     parser.add_argument("-f", "--force", default=False, action="store_true",
                         help="force mode, force cover grasped problems and submissions")
-    args = parser.parse_args()
+    parser.add_argument("-i", "--incremental", default=False, action="store_true",
+                        help="incremental mode, only grasp problems with new AC submissions since last run")
+    parser.add_argument("--history", default=False, action="store_true",
+                        help="history mode, also save the past submissions of each problem to its history/ folder")
+    parser.add_argument("--history-lang", type=str, nargs="+", default=None,
+                        help="languages of history submissions to save, e.g. cpp python3 (default all)")
+    parser.add_argument("--history-status", type=str, default="Accepted",
+                        help="status of history submissions to save, e.g. Accepted, \"Wrong Answer\" or all (default Accepted)")
+    parser.add_argument("--watch", default=False, action="store_true",
+                        help="watch mode, keep running and grasp the problems with new AC submissions when they appear")
+    parser.add_argument("--interval", type=float, default=300,
+                        help="seconds between polls of watch mode, failed polls back off up to --max-interval (default 300)")
+    parser.add_argument("--max-interval", type=float, default=3600,
+                        help="max seconds between polls of watch mode (default 3600)")
+    parser.add_argument("--status-file", type=str, default=None,
+                        help="JSON status of watch mode for supervisors (default problems/watch_status.json)")
+    parser.add_argument("--rebuild-index", default=False, action="store_true",
+                        help="rebuild the index of grasped problems from the problems folder, then exit")
+    parser.add_argument("--cache-dir", type=str,
+                        default=os.path.join(os.path.expanduser("~"), ".cache", "leetcode-cn-crawler"),
+                        help="directory of problem statements cache, can be shared by accounts and output folders\n" +
+                             "(default ~/.cache/leetcode-cn-crawler)")
+    parser.add_argument("--cache-size", type=int, default=512,
+                        help="max size of problem statements cache in MB (default 512)")
+    parser.add_argument("--no-cache", default=False, action="store_true",
+                        help="not use problem statements cache")
+    parser.add_argument("-c", "--credentials", type=str, default=None,
+                        help="JSON file with \"username\" and \"password\", for running without input\n" +
+                             "(or set LEETCODE_USERNAME and LEETCODE_PASSWORD environment variables)")
+    parser.add_argument("--accounts", type=str, default=None,
+                        help="JSON file with a list of accounts, grasped in one process, sharing cache, rate and workers\n" +
+                             "[{\"username\": ..., \"password\": ..., \"output\": folder under problems/ (default username)}]")
+    parser.add_argument("--session-file", type=str,
+                        default=os.path.join(os.path.expanduser("~"), ".leetcode-cn-crawler", "session.json"),
+                        help="file to save login session, reused by next run (default ~/.leetcode-cn-crawler/session.json)")
+    parser.add_argument("--no-session", default=False, action="store_true",
+                        help="always login with password, not save or restore session")
+    parser.add_argument("-o", "--output-format", type=str, default="tree", choices=OUTPUT_FORMATS,
+                        help="output format [ tree(default) -- one file per problem and submission , \n" +
+                             "                 sqlite        -- packed in problems/problems.sqlite , \n" +
+                             "                 zip           -- packed in problems/problems.zip ]")
+    parser.add_argument("--export", type=str, default=None, metavar="DIR",
+                        help="expand the packed archive of --output-format to DIR as a problems tree, then exit")
+    parser.add_argument("--page-size", type=int, default=500,
+                        help="number of problems in one page of summary (default 500)")
+    parser.add_argument("-a", "--assets", default=False, action="store_true",
+                        help="download images in problems to problems/assets/, so they can be viewed offline")
+    parser.add_argument("--asset-workers", type=int, default=4,
+                        help="number of images downloaded concurrently (default 4)")
+    parser.add_argument("--asset-max-size", type=int, default=5,
+                        help="max size of one image in MB, larger ones keep the remote link (default 5)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of problems grasped concurrently (default 1)")
+    parser.add_argument("-k", "--batch-size", type=int, default=10,
+                        help="number of problems queried in one GraphQL request (default 10)")
+    parser.add_argument("-r", "--rate", type=float, default=10.0,
+                        help="max requests per second to the server, 0 means unlimited (default 10)")
+    parser.add_argument("--timeout", type=float, nargs=2, default=[10.0, 60.0], metavar=("CONNECT", "READ"),
+                        help="connect and read timeout of each request in seconds, stalled ones are retried (default 10 60)")
+    parser.add_argument("--report", type=str, default=None,
+                        help="JSON run report with request and write metrics (default problems/crawl_report.json)")
+    parser.add_argument("--prometheus", type=str, default=None,
+                        help="also write the metrics to a Prometheus textfile")
+    parser.add_argument("--server", type=str, default="https://leetcode-cn.com/",
+                        help="LeetCode server, change it only for testing with a local mock server")
+    args = parser.parse_args(argv)
     return args
 
 
-def main():
-    print("  ====================== ")
-    print(" | LeetCode CN Crawler  |")
-    print("  ====================== ")
+def getCredentials(args, ask=True):
+    """
+    Get username and password from credentials file, environment variables, or input if ask
+    """
+    if args.credentials is not None:
+        with open(args.credentials, "r", encoding="utf-8") as f:
+            credentials = json.load(f)
+        return credentials["username"], credentials["password"]
 
-    args = parseArgs()
+    if "LEETCODE_USERNAME" in os.environ and "LEETCODE_PASSWORD" in os.environ:
+        return os.environ["LEETCODE_USERNAME"], os.environ["LEETCODE_PASSWORD"]
+
+    if not ask:
+        return None, None
+    if not sys.stdin.isatty():
+        print(" >> No credentials found. Please use --credentials or environment variables when not interactive.")
+        return None, None
 
     username = input(" >> Please input your username: ")
     password = input(" >> Please input your password: ")
@@ -41,18 +126,89 @@ def main():
     # Not recommanded. It's not safe.
     # username = "your_username"
     # password = "your_password"
+    return username, password
+
+
+def login(lc_client, args):
+    """
+    Login with the credentials, and save the session for next run
+    """
+    username, password = getCredentials(args)
+    if username is None:
+        return False
+    if not lc_client.login(username, password):
+        return False
+    if not args.no_session:
+        lc_client.saveSession(args.session_file, username)
+    return True
+
+
+def crawl(lc_client, args):
+    """
+    Login, then grasp once or watch
+    """
+    # Reuse the session of last run, login only if it expired or belongs to another configured account
+    if args.no_session or not lc_client.restoreSession(args.session_file, getCredentials(args, ask=False)[0]):
+        if not login(lc_client, args):
+            return
+
+    if not args.watch:
+        lc_client.graspAllProblems(args.book)
+        return
 
-    requests.packages.urllib3.disable_warnings()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # stopped by supervisor, still write the status
+    try:
+        # login again when the session expired, as long as the credentials can be read without input
+        while not lc_client.watch(args.book, args.interval, args.max_interval, args.status_file):
+            if not login(lc_client, args):
+                break
+    except KeyboardInterrupt:
+        print(" >> Watch stopped.")
+
+
+def main():
+    print("  ====================== ")
+    print(" | LeetCode CN Crawler  |")
+    print("  ====================== ")
+
+    args = parseArgs()
 
     save_path = os.path.join(os.getcwd(), "problems")
 
-    lc_client = LeetCodeClient(username, password, save_path, args)
+    if args.export is not None:
+        if args.output_format == "tree":
+            print(" >> Nothing to export. Please select a packed --output-format.")
+            return
+        if not os.path.exists(os.path.join(save_path, ARCHIVE_FILE_NAMES[args.output_format])):
+            print(" >> No archive found in {:s}.".format(save_path))
+            return
+        file_count = exportArchive(args.output_format, save_path, args.export)
+        print(" >> Export {:d} files to {:s}.".format(file_count, args.export))
+        return
 
-    ret = lc_client.login(retry_time_interval=5.0)
-    if not ret:
+    if args.rebuild_index:
+        lc_client = LeetCodeClient(save_path, args)
+        try:
+            lc_client.rebuildIndex()
+        finally:
+            lc_client.close()
         return
 
-    lc_client.graspAllProblems(args.book)
+    requests.packages.urllib3.disable_warnings()
+
+    if args.accounts is not None:
+        if args.watch:
+            print(" >> Watch mode works with one account. Please run one watcher for each account.")
+            return
+        crawlTeam(args, save_path)
+        return
+
+    lc_client = LeetCodeClient(save_path, args)
+    try:
+        crawl(lc_client, args)
+    finally:
+        lc_client.close()
+
 
 
 
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sqlite3
+import threading
+
+import utils
+
+
+class Manifest:
+    """
+    Local index of the grasped problems, stored as SQLite under the save path
+    """
+    def __init__(self, save_path, file_name="manifest.db"):
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        self.__save_path = save_path
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(os.path.join(save_path, file_name), check_same_thread=False)
+        self.__conn.row_factory = sqlite3.Row
+        with self.__conn:
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS problems ("
+                "book TEXT NOT NULL, qid TEXT NOT NULL, slug TEXT, title TEXT, translated_title TEXT, "
+                "difficulty TEXT, lang TEXT, submission_id TEXT, timestamp INTEGER, "
+                "problem_file TEXT, code_file TEXT, tags TEXT, history_id TEXT, history_filter TEXT, PRIMARY KEY (book, qid))")
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS cursors ("
+                "account TEXT PRIMARY KEY, submission_id TEXT, timestamp INTEGER)")
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS assets ("
+                "url TEXT PRIMARY KEY, file_name TEXT NOT NULL)")
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS summary_files ("
+                "book TEXT NOT NULL, file_name TEXT NOT NULL, digest TEXT, PRIMARY KEY (book, file_name))")
+
+            # add the columns missing in manifest of older version
+            columns = [row["name"] for row in self.__conn.execute("PRAGMA table_info(problems)")]
+            for column in ["tags", "history_id", "history_filter"]:
+                if column not in columns:
+                    self.__conn.execute("ALTER TABLE problems ADD COLUMN {:s} TEXT".format(column))
+
+
+    def getProblem(self, book_name, qid):
+        with self.__lock:
+            row = self.__conn.execute("SELECT * FROM problems WHERE book = ? AND qid = ?", (book_name, qid)).fetchone()
+        return dict(row) if row is not None else None
+
+
+    def getProblems(self, book_name):
+        """
+        Return the problems of a book whose problem and code files are both written
+        """
+        with self.__lock:
+            rows = self.__conn.execute("SELECT * FROM problems WHERE book = ? AND problem_file IS NOT NULL "
+                                       "AND code_file IS NOT NULL", (book_name,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+    def getProblemsBySlug(self, slug):
+        """
+        Return the problem in every book where it is found
+        """
+        with self.__lock:
+            rows = self.__conn.execute("SELECT * FROM problems WHERE slug = ?", (slug,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+    def update(self, book_name, qid, **fields):
+        """
+        Insert or update the fields of a problem in one transaction
+        File paths are relative to the book directory.
+        """
+        columns = ["book", "qid"] + list(fields.keys())
+        values = [book_name, qid] + list(fields.values())
+        updates = ", ".join("{:s} = excluded.{:s}".format(column, column) for column in fields.keys())
+        sql = "INSERT INTO problems ({:s}) VALUES ({:s}) ON CONFLICT (book, qid) DO ".format(
+                ", ".join(columns), ", ".join("?" * len(columns)))
+        sql += "UPDATE SET " + updates if len(fields) > 0 else "NOTHING"
+        with self.__lock, self.__conn:
+            self.__conn.execute(sql, values)
+
+
+    def getCursor(self, cursor_key):
+        """
+        Return the newest submission seen by the last incremental sync, None if never synced
+        cursor_key is the account name, with the books if not all of them are synced.
+        """
+        with self.__lock:
+            row = self.__conn.execute("SELECT * FROM cursors WHERE account = ?", (cursor_key,)).fetchone()
+        return dict(row) if row is not None else None
+
+
+    def setCursor(self, cursor_key, submission_id, timestamp):
+        with self.__lock, self.__conn:
+            self.__conn.execute("INSERT OR REPLACE INTO cursors (account, submission_id, timestamp) VALUES (?, ?, ?)",
+                                (cursor_key, submission_id, timestamp))
+
+
+    def getAsset(self, url):
+        """
+        Return the file name of a downloaded image in assets store, None if not downloaded
+        """
+        with self.__lock:
+            row = self.__conn.execute("SELECT file_name FROM assets WHERE url = ?", (url,)).fetchone()
+        return row["file_name"] if row is not None else None
+
+
+    def setAsset(self, url, file_name):
+        with self.__lock, self.__conn:
+            self.__conn.execute("INSERT OR REPLACE INTO assets (url, file_name) VALUES (?, ?)", (url, file_name))
+
+
+    def getSummaryDigests(self, book_name):
+        """
+        Return the digests of summary files written last time, file name -> digest
+        """
+        with self.__lock:
+            rows = self.__conn.execute("SELECT file_name, digest FROM summary_files WHERE book = ?", (book_name,)).fetchall()
+        return {row["file_name"]: row["digest"] for row in rows}
+
+
+    def setSummaryDigests(self, book_name, digests):
+        with self.__lock, self.__conn:
+            self.__conn.execute("DELETE FROM summary_files WHERE book = ?", (book_name,))
+            self.__conn.executemany("INSERT INTO summary_files (book, file_name, digest) VALUES (?, ?, ?)",
+                                    [(book_name, file_name, digest) for file_name, digest in digests.items()])
+
+
+    def rebuild(self, book_list):
+        """
+        Recover the manifest from an existing problems tree
+        Return the number of problems found.
+        """
+        difficulty_transform = {value: key for key, value in utils.DIFFICULTY_TRANSFORM.items() if key != "Default"}
+        file_format_transform = {}
+        for lang_slug, lang in utils.LANG_SLUG_TRANSFORM.items():
+            file_format_transform.setdefault(utils.LANG_FILE_FORMAT[lang], lang_slug)  # ".py" -> first python
+
+        rows = []
+        for book_name in book_list:
+            book_path = os.path.join(self.__save_path, book_name)
+            if not os.path.isdir(book_path):
+                continue
+            for problem_dir in os.listdir(book_path):
+                if " - " not in problem_dir or not os.path.isdir(os.path.join(book_path, problem_dir)):
+                    continue
+                qid, translated_title = problem_dir.split(" - ", 1)
+                problem_file, code_file, difficulty, lang = None, None, None, None
+                for file in os.listdir(os.path.join(book_path, problem_dir)):
+                    if file == translated_title + ".html":
+                        problem_file = os.path.join(problem_dir, file)
+                        with open(os.path.join(book_path, problem_file), "r", encoding="utf-8") as f:
+                            match = re.search(r"<h4>.*?</font> (<font .*?</font>)</h4>", f.read())
+                        if match is not None:
+                            difficulty = difficulty_transform.get(match.group(1))
+                    elif os.path.splitext(file)[0] == translated_title and os.path.splitext(file)[1] in file_format_transform:
+                        code_file = os.path.join(problem_dir, file)
+                        lang = file_format_transform.get(os.path.splitext(file)[1])
+                rows.append((book_name, qid, translated_title, difficulty, lang, problem_file, code_file))
+
+        with self.__lock, self.__conn:
+            self.__conn.execute("DELETE FROM problems")
+            self.__conn.executemany("INSERT INTO problems (book, qid, translated_title, difficulty, lang, "
+                                    "problem_file, code_file) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf")]  # seconds
+WRITE_LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, float("inf")]  # local disk
+
+
+class Histogram:
+    """
+    Cumulative histogram in Prometheus style
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+
+    def observe(self, value):
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] = self.counts[idx] + 1
+        self.count = self.count + 1
+        self.sum = self.sum + value
+
+
+    def toDict(self):
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                            for bound, count in zip(self.buckets, self.counts)}}
+
+
+class Metrics:
+    """
+    Counters of one crawl run: requests per operation, retries, throttling, sleeping and file writes
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__start_time = time.monotonic()
+        self.__requests = {}  # operation -> { count, failures, bytes_received, bytes_sent, latency(Histogram) }
+        self.__retries = {}  # operation -> { error kind -> count }
+        self.__throttled = 0
+        self.__sleep_time = {}  # rate_limit / backoff / circuit_breaker -> seconds
+        self.__writes = {}  # file kind -> { count, bytes, latency(Histogram) }
+        self.__problems_done = 0
+        self.__problems_failed = 0
+
+
+    def observeRequest(self, operation, latency, bytes_sent, bytes_received, failed=False):
+        with self.__lock:
+            stats = self.__requests.setdefault(operation, {"count": 0, "failures": 0, "bytes_sent": 0,
+                                                           "bytes_received": 0, "latency": Histogram()})
+            stats["count"] = stats["count"] + 1
+            stats["failures"] = stats["failures"] + (1 if failed else 0)
+            stats["bytes_sent"] = stats["bytes_sent"] + bytes_sent
+            stats["bytes_received"] = stats["bytes_received"] + bytes_received
+            stats["latency"].observe(latency)
+
+
+    def observeRetry(self, operation, error_kind):
+        with self.__lock:
+            retries = self.__retries.setdefault(operation, {})
+            retries[error_kind] = retries.get(error_kind, 0) + 1
+            if error_kind == "ThrottledError":
+                self.__throttled = self.__throttled + 1
+
+
+    def observeSleep(self, reason, seconds):
+        if seconds <= 0:
+            return
+        with self.__lock:
+            self.__sleep_time[reason] = self.__sleep_time.get(reason, 0.0) + seconds
+
+
+    @contextlib.contextmanager
+    def writing(self, kind, size=0):
+        """
+        Measure a file write of size bytes (encoded), e.g. with metrics.writing("code_file", len(data)): ...
+        """
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            latency = time.monotonic() - start_time
+            with self.__lock:
+                stats = self.__writes.setdefault(kind, {"count": 0, "bytes": 0, "latency": Histogram(WRITE_LATENCY_BUCKETS)})
+                stats["count"] = stats["count"] + 1
+                stats["bytes"] = stats["bytes"] + size
+                stats["latency"].observe(latency)
+
+
+    def problemsDone(self, count, failed=0):
+        with self.__lock:
+            self.__problems_done = self.__problems_done + count
+            self.__problems_failed = self.__problems_failed + failed
+
+
+    def rateString(self):
+        """
+        Live rates for the postfix of progress bar
+        """
+        with self.__lock:
+            elapsed = max(time.monotonic() - self.__start_time, 1e-6)
+            request_count = sum(stats["count"] for stats in self.__requests.values())
+            return "{:.1f}req/s {:.1f}prob/s".format(request_count / elapsed, self.__problems_done / elapsed)
+
+
+    def report(self):
+        with self.__lock:
+            elapsed = time.monotonic() - self.__start_time
+            request_count = sum(stats["count"] for stats in self.__requests.values())
+            return {
+                "elapsed": round(elapsed, 3),
+                "problems_done": self.__problems_done,
+                "problems_failed": self.__problems_failed,
+                "problems_per_sec": round(self.__problems_done / elapsed, 3) if elapsed > 0 else 0.0,
+                "requests": request_count,
+                "requests_per_sec": round(request_count / elapsed, 3) if elapsed > 0 else 0.0,
+                "throttled": self.__throttled,
+                "operations": {operation: dict(stats, latency=stats["latency"].toDict())
+                               for operation, stats in self.__requests.items()},
+                "retries": {operation: dict(retries) for operation, retries in self.__retries.items()},
+                "sleep_time": {reason: round(seconds, 3) for reason, seconds in self.__sleep_time.items()},
+                "writes": {kind: dict(stats, latency=stats["latency"].toDict()) for kind, stats in self.__writes.items()}
+            }
+
+
+    def writeReport(self, file_path):
+        report = self.report()
+        writeAtomically(file_path, json.dumps(report, indent=2, ensure_ascii=False))
+        return report
+
+
+    def writePrometheus(self, file_path):
+        """
+        Write the metrics in Prometheus textfile format, for node_exporter textfile collector
+        """
+        report = self.report()
+        lines = []
+
+        def addHistogram(name, labels, histogram):
+            for bound, count in histogram["buckets"].items():
+                lines.append("{:s}_bucket{{{:s},le=\"{:s}\"}} {:d}".format(name, labels, bound, count))
+            lines.append("{:s}_sum{{{:s}}} {:f}".format(name, labels, histogram["sum"]))
+            lines.append("{:s}_count{{{:s}}} {:d}".format(name, labels, histogram["count"]))
+
+        lines.append("# TYPE lc_crawler_requests_total counter")
+        for operation, stats in report["operations"].items():
+            lines.append("lc_crawler_requests_total{{operation=\"{:s}\"}} {:d}".format(operation, stats["count"]))
+        lines.append("# TYPE lc_crawler_request_failures_total counter")
+        for operation, stats in report["operations"].items():
+            lines.append("lc_crawler_request_failures_total{{operation=\"{:s}\"}} {:d}".format(operation, stats["failures"]))
+        lines.append("# TYPE lc_crawler_response_bytes_total counter")
+        for operation, stats in report["operations"].items():
+            lines.append("lc_crawler_response_bytes_total{{operation=\"{:s}\"}} {:d}".format(operation, stats["bytes_received"]))
+        lines.append("# TYPE lc_crawler_request_seconds histogram")
+        for operation, stats in report["operations"].items():
+            addHistogram("lc_crawler_request_seconds", "operation=\"{:s}\"".format(operation), stats["latency"])
+        lines.append("# TYPE lc_crawler_retries_total counter")
+        for operation, retries in report["retries"].items():
+            for error_kind, count in retries.items():
+                lines.append("lc_crawler_retries_total{{operation=\"{:s}\",error=\"{:s}\"}} {:d}".format(operation, error_kind, count))
+        lines.append("# TYPE lc_crawler_throttled_total counter")
+        lines.append("lc_crawler_throttled_total {:d}".format(report["throttled"]))
+        lines.append("# TYPE lc_crawler_sleep_seconds_total counter")
+        for reason, seconds in report["sleep_time"].items():
+            lines.append("lc_crawler_sleep_seconds_total{{reason=\"{:s}\"}} {:f}".format(reason, seconds))
+        lines.append("# TYPE lc_crawler_write_seconds histogram")
+        for kind, stats in report["writes"].items():
+            addHistogram("lc_crawler_write_seconds", "kind=\"{:s}\"".format(kind), stats["latency"])
+        lines.append("# TYPE lc_crawler_problems_total counter")
+        lines.append("lc_crawler_problems_total{{result=\"done\"}} {:d}".format(report["problems_done"]))
+        lines.append("lc_crawler_problems_total{{result=\"failed\"}} {:d}".format(report["problems_failed"]))
+        lines.append("# TYPE lc_crawler_run_seconds gauge")
+        lines.append("lc_crawler_run_seconds {:f}".format(report["elapsed"]))
+        lines.append("# TYPE lc_crawler_last_run_timestamp_seconds gauge")
+        lines.append("lc_crawler_last_run_timestamp_seconds {:d}".format(int(time.time())))
+
+        writeAtomically(file_path, "\n".join(lines) + "\n")
+
+
+def writeAtomically(file_path, content):
+    # collectors may read the file at any time, never show a half-written one
+    file_dir = os.path.dirname(file_path)
+    if file_dir != "" and not os.path.exists(file_dir):
+        os.makedirs(file_dir)
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(temp_path, file_path)
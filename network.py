@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+import time
+import random
+import datetime
+import threading
+import email.utils
+import requests
+
+
+class RateLimiter:
+    """
+    Global requests-per-second limiter (token bucket), shared by all workers
+    """
+    def __init__(self, rate, burst=None):
+        self.__rate = float(rate)  # <= 0 means unlimited
+        self.__burst = float(burst) if burst is not None else max(1.0, self.__rate)
+        self.__tokens = self.__burst
+        self.__last_time = time.monotonic()
+        self.__lock = threading.Lock()
+
+
+    def acquire(self):
+        """
+        Block until a request is allowed. Return the time spent waiting.
+        """
+        if self.__rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__burst, self.__tokens + (now - self.__last_time) * self.__rate)
+                self.__last_time = now
+                if self.__tokens >= 1.0:
+                    self.__tokens = self.__tokens - 1.0
+                    return waited
+                wait_time = (1.0 - self.__tokens) / self.__rate
+            time.sleep(wait_time)
+            waited = waited + wait_time
+
+
+class RequestError(Exception):
+    """
+    Base class of the classified request failures, not retried by default
+    """
+    retryable = False
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after  # seconds asked by server, or None
+
+
+class ConnectionFailure(RequestError):
+    retryable = True
+
+
+class ThrottledError(RequestError):  # 429
+    retryable = True
+
+
+class ServerError(RequestError):  # 5xx or broken response body
+    retryable = True
+
+
+class NullDataError(RequestError):  # GraphQL answered without data
+    retryable = True
+
+
+class AuthExpiredError(RequestError):  # 401 / 403, login again instead of retrying
+    pass
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, limited by a retry budget shared by the whole run
+    (or by each cycle of a long-running process, see refill)
+    """
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=30.0, retry_budget=200):
+        self.max_retries = max_retries
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__initial_budget = retry_budget
+        self.__retry_budget = retry_budget
+        self.__lock = threading.Lock()
+
+
+    def refill(self):
+        """
+        Reset the retry budget to its initial size
+        """
+        with self.__lock:
+            self.__retry_budget = self.__initial_budget
+
+
+    def delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.__max_delay, self.__base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Sleep before the retry of the attempt. Return the time slept, None if the retry budget runs out.
+        """
+        with self.__lock:
+            if self.__retry_budget <= 0:
+                return None
+            self.__retry_budget = self.__retry_budget - 1
+        delay = self.delay(attempt, retry_after)
+        time.sleep(delay)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Pause all the requests for a while after too many failures in a row
+    """
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.__failure_threshold = failure_threshold
+        self.__cooldown = cooldown
+        self.__failures = 0
+        self.__open_until = 0.0
+        self.__lock = threading.Lock()
+
+
+    def wait(self):
+        """
+        Block while the circuit is open. Return the time spent waiting.
+        """
+        with self.__lock:
+            wait_time = self.__open_until - time.monotonic()
+        if wait_time <= 0:
+            return 0.0
+        time.sleep(wait_time)
+        return wait_time
+
+
+    def recordSuccess(self):
+        with self.__lock:
+            self.__failures = 0
+
+
+    def recordFailure(self):
+        with self.__lock:
+            self.__failures = self.__failures + 1
+            now = time.monotonic()
+            # after the cooldown, one more failure opens the circuit again
+            if self.__failures >= self.__failure_threshold and self.__open_until <= now:
+                self.__open_until = now + self.__cooldown
+                print(" >> Too many request failures. Pause requests for {:.0f} seconds.".format(self.__cooldown))
+
+
+class HTTPRequester:
+    """
+    The request layer shared by all HTTP calls: rate limit, error classification,
+    retry with backoff and circuit breaker
+    """
+    def __init__(self, session, rate_limiter, retry_policy, circuit_breaker, metrics=None, timeout=(10.0, 60.0)):
+        """
+        timeout: default (connect, read) seconds of the requests, a stalled connection fails and is retried
+        """
+        self.session = session
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.metrics = metrics
+
+
+    def request(self, method, url, parse=None, operation="other", **kwargs):
+        """
+        Send a request, retry the retryable failures.
+        parse(response) turns the response into the result, and may raise RequestError.
+        operation names the request in metrics.
+        """
+        attempt = 0
+        while True:
+            try:
+                self.__observeSleep("circuit_breaker", self.circuit_breaker.wait())
+                self.__observeSleep("rate_limit", self.rate_limiter.acquire())
+                response = self.__send(method, url, operation, **kwargs)
+                result = parse(response) if parse is not None else response
+                self.circuit_breaker.recordSuccess()
+                return result
+            except RequestError as error:
+                if not isinstance(error, NullDataError):  # the server is answering, not a failure of it
+                    self.circuit_breaker.recordFailure()
+                if not error.retryable or attempt >= self.retry_policy.max_retries:
+                    raise
+                if self.metrics is not None:
+                    self.metrics.observeRetry(operation, type(error).__name__)
+                if not self.backoff(attempt, operation, error.retry_after):
+                    raise RequestError("Retry budget exhausted. Last error: {:s}".format(str(error)))
+                attempt = attempt + 1
+
+
+    def backoff(self, attempt, operation="other", retry_after=None):
+        """
+        Sleep before a retry. Return False if the retry budget runs out.
+        """
+        delay = self.retry_policy.backoff(attempt, retry_after)
+        if delay is None:
+            return False
+        self.__observeSleep("backoff", delay)
+        return True
+
+
+    def __observeSleep(self, reason, seconds):
+        if self.metrics is not None:
+            self.metrics.observeSleep(reason, seconds)
+
+
+    def __send(self, method, url, operation, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        start_time = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            if self.metrics is not None:
+                self.metrics.observeRequest(operation, time.monotonic() - start_time, 0, 0, failed=True)
+            raise ConnectionFailure("Connection failed: {:s}".format(str(error)))
+
+        if self.metrics is not None:
+            body = response.request.body or b""
+            if kwargs.get("stream"):  # body read later by the caller, within its own size limit
+                bytes_received = int(response.headers.get("Content-Length") or 0)
+            elif "Content-Encoding" in response.headers:  # size on the wire, not decompressed
+                bytes_received = int(response.headers.get("Content-Length") or len(response.content))
+            else:
+                bytes_received = len(response.content)
+            self.metrics.observeRequest(operation, time.monotonic() - start_time, len(body), bytes_received,
+                                        failed=not response.ok)
+
+        if not response.ok:
+            response.close()  # a streamed body is not read, give the connection back to the pool
+        if response.status_code == 429:
+            raise ThrottledError("Throttled by server.", parseRetryAfter(response))
+        if response.status_code >= 500:
+            raise ServerError("Server error {:d}.".format(response.status_code), parseRetryAfter(response))
+        if response.status_code in (401, 403):
+            raise AuthExpiredError("Not authorized {:d}.".format(response.status_code))
+        if not response.ok:
+            raise RequestError("Bad response {:d}.".format(response.status_code))
+        return response
+
+
+def parseJSON(response):
+    try:
+        return response.json()
+    except ValueError:
+        raise ServerError("Broken JSON response.")
+
+
+def parseGraphQL(response):
+    """
+    Return the data of a GraphQL response, NullDataError if it is null
+    """
+    data = parseJSON(response).get("data")
+    if data is None:
+        raise NullDataError("GraphQL response without data.")
+    return data
+
+
+def parseRetryAfter(response):
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:  # HTTP date
+        try:
+            return max(0.0, (email.utils.parsedate_to_datetime(retry_after) - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+GraphQL field profiles, selected with --fields
+    minimal -- only the fields written to the problem pages, code files and manifest
+    archive -- and the metadata worth keeping offline (stats, hints, test cases, runtime...), saved to a sidecar JSON
+    full    -- every field the web page queries
+Questions are cached and shared by accounts, so their fields of the signed-in user
+(status, isLiked, isSubscribed, dailyRecordStatus, solution.canSeeDetail) are never queried.
+"""
+
+FIELD_PROFILES = ["minimal", "archive", "full"]
+
+QUESTION_FIELDS = {
+    "minimal": "    translatedTitle\n    translatedContent\n    difficulty\n    topicTags {\n      translatedName\n    }\n",
+    "archive": "    questionId\n    questionFrontendId\n    categoryTitle\n    title\n    titleSlug\n    translatedTitle\n    translatedContent\n    isPaidOnly\n    difficulty\n    likes\n    dislikes\n    similarQuestions\n    topicTags {\n      name\n      slug\n      translatedName\n    }\n    stats\n    hints\n    sampleTestCase\n    exampleTestcases\n",
+    "full": "    questionId\n    questionFrontendId\n    categoryTitle\n    boundTopicId\n    title\n    titleSlug\n    content\n    translatedTitle\n    translatedContent\n    isPaidOnly\n    difficulty\n    likes\n    dislikes\n    similarQuestions\n    contributors {\n      username\n      profileUrl\n      avatarUrl\n      __typename\n    }\n    langToValidPlayground\n    topicTags {\n      name\n      slug\n      translatedName\n      __typename\n    }\n    companyTagStats\n    codeSnippets {\n      lang\n      langSlug\n      code\n      __typename\n    }\n    stats\n    hints\n    solution {\n      id\n      __typename\n    }\n    sampleTestCase\n    metaData\n    judgerAvailable\n    judgeType\n    mysqlSchemas\n    enableRunCode\n    envInfo\n    book {\n      id\n      bookName\n      pressName\n      source\n      shortDescription\n      fullDescription\n      bookImgUrl\n      pressImgUrl\n      productUrl\n      __typename\n    }\n    isDailyQuestion\n    editorType\n    ugcQuestionId\n    style\n    exampleTestcases\n    __typename\n"
+}
+
+SUBMISSION_DETAIL_FIELDS = {
+    "minimal": "    id\n    code\n    lang\n    question {\n      translatedTitle\n    }\n",
+    "archive": "    id\n    code\n    runtime\n    memory\n    statusDisplay\n    timestamp\n    lang\n    passedTestCaseCnt\n    totalTestCaseCnt\n    question {\n      translatedTitle\n    }\n",
+    "full": "    id\n    code\n    runtime\n    memory\n    rawMemory\n    statusDisplay\n    timestamp\n    lang\n    passedTestCaseCnt\n    totalTestCaseCnt\n    sourceUrl\n    question {\n      titleSlug\n      title\n      translatedTitle\n      questionId\n      __typename\n    }\n    ... on GeneralSubmissionNode {\n      outputDetail {\n        codeOutput\n        expectedOutput\n        input\n        compileError\n        runtimeError\n        lastTestcase\n        __typename\n      }\n      __typename\n    }\n    submissionComment {\n      comment\n      flagType\n      __typename\n    }\n    __typename\n"
+}
+
+SUBMISSION_LIST_FIELDS = {
+    "minimal": "      id\n      statusDisplay\n      lang\n      timestamp\n      url\n",
+    "archive": "      id\n      statusDisplay\n      lang\n      timestamp\n      url\n",
+    "full": "      id\n      statusDisplay\n      lang\n      runtime\n      timestamp\n      url\n      isPending\n      memory\n      submissionComment {\n        comment\n        flagType\n        __typename\n      }\n      __typename\n"
+}
+
+# fields used by the pages, code files and manifest, the others go to the sidecar JSON
+# (id, title and slug of questions come from the book lists)
+QUESTION_USED_FIELDS = {"translatedTitle", "translatedContent", "difficulty", "topicTags", "__typename"}
+SUBMISSION_USED_FIELDS = {"id", "code", "lang", "question", "__typename"}
+
+
+def submissionListQuery(profile):
+    return ("query submissions($offset: Int!, $limit: Int!, $lastKey: String, $questionSlug: String!, $markedOnly: Boolean, $lang: String) {\n"
+            "  submissionList(offset: $offset, limit: $limit, lastKey: $lastKey, questionSlug: $questionSlug, markedOnly: $markedOnly, lang: $lang) {\n"
+            "    lastKey\n    hasNext\n    submissions {\n" + SUBMISSION_LIST_FIELDS[profile] + "    }\n  }\n}\n")
+
+
+def extraFields(details, used_fields):
+    """
+    Fields of a query result not used by the output, for the sidecar JSON
+    """
+    return {key: value for key, value in details.items() if key not in used_fields}
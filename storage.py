@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import queue
+import shutil
+import sqlite3
+import hashlib
+import zipfile
+import tempfile
+import threading
+
+OUTPUT_FORMATS = ["tree", "sqlite", "zip"]
+ARCHIVE_FILE_NAMES = {"sqlite": "problems.sqlite", "zip": "problems.zip"}
+
+
+class TreeStorage:
+    """
+    Output files as a directory tree under the save path, one file per problem and submission
+    Paths are relative to the save path.
+    """
+    def __init__(self, root_path):
+        self.__root_path = root_path
+        self.__lock = threading.Lock()
+        self.__known_dirs = set()  # directories created already, not checked again
+
+
+    def write(self, relative_path, chunks):
+        """
+        Stream the chunks (str or bytes) to a temp file, then rename it over the file,
+        readers never see a half-written one. Return the digest of content.
+        """
+        file_path = os.path.join(self.__root_path, *relative_path.split("/"))
+        file_dir = os.path.dirname(file_path)
+        with self.__lock:
+            if file_dir not in self.__known_dirs:
+                os.makedirs(file_dir, exist_ok=True)
+                self.__known_dirs.add(file_dir)
+
+        sha1 = hashlib.sha1()
+        fd, temp_path = tempfile.mkstemp(dir=file_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                chunk = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+                sha1.update(chunk)
+                f.write(chunk)
+        os.chmod(temp_path, 0o644)  # mkstemp creates private files
+        os.replace(temp_path, file_path)
+        return sha1.hexdigest()
+
+
+    def exists(self, relative_path):
+        return os.path.exists(os.path.join(self.__root_path, *relative_path.split("/")))
+
+
+    def remove(self, relative_path):
+        file_path = os.path.join(self.__root_path, *relative_path.split("/"))
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+    def iterFiles(self):
+        """
+        Generate (relative path, content bytes) of all the files
+        """
+        for dir_path, _, file_names in os.walk(self.__root_path):
+            for file_name in file_names:
+                file_path = os.path.join(dir_path, file_name)
+                with open(file_path, "rb") as f:
+                    yield os.path.relpath(file_path, self.__root_path).replace(os.sep, "/"), f.read()
+
+
+    def commit(self):
+        pass
+
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """
+    Output files packed in one SQLite database, written in batched transactions
+    """
+    def __init__(self, archive_path, commit_interval=500):
+        archive_dir = os.path.dirname(archive_path)
+        if archive_dir != "" and not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+        self.__commit_interval = commit_interval
+        self.__lock = threading.Lock()
+        self.__pending_count = 0  # writes not committed yet
+        self.__conn = sqlite3.connect(archive_path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        with self.__conn:
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, content BLOB NOT NULL, digest TEXT NOT NULL, mtime INTEGER NOT NULL)")
+
+
+    def write(self, relative_path, chunks):
+        """
+        Same as TreeStorage.write, committed with the following writes
+        """
+        relative_path = relative_path.replace(os.sep, "/")
+        content = b"".join(chunk.encode("utf-8") if isinstance(chunk, str) else chunk for chunk in chunks)
+        digest = hashlib.sha1(content).hexdigest()
+
+        with self.__lock:
+            self.__conn.execute("INSERT OR REPLACE INTO files (path, content, digest, mtime) VALUES (?, ?, ?, ?)",
+                                (relative_path, content, digest, int(time.time())))
+            self.__pending_count = self.__pending_count + 1
+            if self.__pending_count >= self.__commit_interval:
+                self.__conn.commit()
+                self.__pending_count = 0
+        return digest
+
+
+    def exists(self, relative_path):
+        relative_path = relative_path.replace(os.sep, "/")
+        with self.__lock:
+            row = self.__conn.execute("SELECT 1 FROM files WHERE path = ?", (relative_path,)).fetchone()
+        return row is not None
+
+
+    def remove(self, relative_path):
+        relative_path = relative_path.replace(os.sep, "/")
+        with self.__lock:
+            self.__conn.execute("DELETE FROM files WHERE path = ?", (relative_path,))
+            self.__pending_count = self.__pending_count + 1
+
+
+    def iterFiles(self):
+        with self.__lock:
+            paths = [row[0] for row in self.__conn.execute("SELECT path FROM files ORDER BY path")]
+        for path in paths:  # one file in memory at a time
+            with self.__lock:
+                row = self.__conn.execute("SELECT content FROM files WHERE path = ?", (path,)).fetchone()
+            if row is not None:
+                yield path, row[0]
+
+
+    def commit(self):
+        with self.__lock:
+            self.__conn.commit()
+            self.__pending_count = 0
+
+
+    def close(self):
+        with self.__lock:
+            self.__conn.commit()
+            self.__conn.close()
+
+
+class ZipStorage:
+    """
+    Output files packed in one zip archive
+    New files go to a temp archive, which replaces the old one on commit together with
+    the old files not overwritten, so the archive is always a complete one.
+    """
+    def __init__(self, archive_path):
+        archive_dir = os.path.dirname(archive_path)
+        if archive_dir != "" and not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+        self.__archive_path = archive_path
+        self.__lock = threading.Lock()
+        self.__old_archive = None
+        self.__old_names = set()
+        self.__new_archive = None  # created at the first write
+        self.__temp_path = None
+        self.__written_names = set()
+        self.__removed_names = set()
+        self.__openOldArchive()
+
+
+    def write(self, relative_path, chunks):
+        """
+        Same as TreeStorage.write, seen by other readers after commit
+        """
+        relative_path = relative_path.replace(os.sep, "/")
+        content = b"".join(chunk.encode("utf-8") if isinstance(chunk, str) else chunk for chunk in chunks)
+        digest = hashlib.sha1(content).hexdigest()
+
+        info = zipfile.ZipInfo(relative_path, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        with self.__lock:
+            if self.__new_archive is None:
+                fd, self.__temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.__archive_path)), suffix=".tmp")
+                os.close(fd)
+                self.__new_archive = zipfile.ZipFile(self.__temp_path, "w", zipfile.ZIP_DEFLATED)
+            self.__new_archive.writestr(info, content)
+            self.__written_names.add(relative_path)
+            self.__removed_names.discard(relative_path)
+        return digest
+
+
+    def exists(self, relative_path):
+        relative_path = relative_path.replace(os.sep, "/")
+        with self.__lock:
+            return relative_path in self.__written_names or \
+                   (relative_path in self.__old_names and relative_path not in self.__removed_names)
+
+
+    def remove(self, relative_path):
+        relative_path = relative_path.replace(os.sep, "/")
+        with self.__lock:
+            self.__removed_names.add(relative_path)
+
+
+    def iterFiles(self):
+        """
+        Generate the files of the committed archive
+        """
+        with self.__lock:
+            names = sorted(self.__old_names)
+        for name in names:
+            if not name.endswith("/"):
+                yield name, self.__old_archive.read(name)
+
+
+    def commit(self):
+        with self.__lock:
+            if self.__new_archive is None and len(self.__removed_names) == 0:
+                return
+            if self.__new_archive is None:
+                fd, self.__temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.__archive_path)), suffix=".tmp")
+                os.close(fd)
+                self.__new_archive = zipfile.ZipFile(self.__temp_path, "w", zipfile.ZIP_DEFLATED)
+
+            # carry over the old files, streamed one by one
+            if self.__old_archive is not None:
+                for info in self.__old_archive.infolist():
+                    if info.filename in self.__written_names or info.filename in self.__removed_names:
+                        continue
+                    with self.__old_archive.open(info) as src, self.__new_archive.open(info, "w") as dst:
+                        shutil.copyfileobj(src, dst)
+                self.__old_archive.close()
+            self.__new_archive.close()
+            os.chmod(self.__temp_path, 0o644)
+            os.replace(self.__temp_path, self.__archive_path)
+
+            self.__new_archive, self.__temp_path = None, None
+            self.__written_names, self.__removed_names = set(), set()
+            self.__openOldArchive()
+
+
+    def close(self):
+        self.commit()
+        with self.__lock:
+            if self.__old_archive is not None:
+                self.__old_archive.close()
+                self.__old_archive = None
+
+
+    def __openOldArchive(self):
+        if os.path.exists(self.__archive_path):
+            self.__old_archive = zipfile.ZipFile(self.__archive_path, "r")
+            self.__old_names = set(self.__old_archive.namelist())
+        else:
+            self.__old_archive, self.__old_names = None, set()
+
+
+class StorageWriter:
+    """
+    Write stage of the crawl: files are written to the storage by a background thread in order,
+    so fetching does not wait for the disk. Writing blocks only when max_pending files are queued,
+    then a slow disk slows the fetching down instead of piling up memory.
+    """
+    def __init__(self, storage, metrics=None, max_pending=256):
+        self.__storage = storage
+        self.__metrics = metrics
+        self.__queue = queue.Queue(maxsize=max_pending)
+        self.__failed_count = 0  # failed writes since last flush
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+
+    def write(self, relative_path, chunks, kind="file", then=None):
+        """
+        Queue a file, then() is called after it is written, e.g. to record it in manifest
+        """
+        self.__queue.put((relative_path, list(chunks), kind, then))
+
+
+    def call(self, then):
+        """
+        Queue a function called after the files queued before are written, skipped if any of them failed
+        """
+        self.__queue.put((None, None, None, then))
+
+
+    def flush(self):
+        """
+        Wait for the queued files, return the number of failed writes since last flush
+        """
+        self.__queue.join()
+        failed_count, self.__failed_count = self.__failed_count, 0
+        return failed_count
+
+
+    def close(self):
+        self.flush()
+        self.__queue.put(None)
+        self.__thread.join()
+
+
+    def __run(self):
+        while True:
+            job = self.__queue.get()
+            if job is None:
+                self.__queue.task_done()
+                return
+            relative_path, chunks, kind, then = job
+            try:
+                if relative_path is not None:
+                    # encoded once here, so the bytes are counted, not the characters
+                    chunks = [chunk.encode("utf-8") if isinstance(chunk, str) else chunk for chunk in chunks]
+                    if self.__metrics is not None:
+                        with self.__metrics.writing(kind, sum(len(chunk) for chunk in chunks)):
+                            self.__storage.write(relative_path, chunks)
+                    else:
+                        self.__storage.write(relative_path, chunks)
+                elif self.__failed_count > 0:
+                    then = None
+                if then is not None:
+                    then()
+            except Exception as error:  # keep writing the others, the failed ones are grasped again next run
+                self.__failed_count = self.__failed_count + 1
+                print(" >> Write {:s} failed. {:s}".format(str(relative_path), str(error)))
+            finally:
+                self.__queue.task_done()
+
+
+def openStorage(output_format, save_path):
+    """
+    Open the output storage of a format, packed archives are kept under the save path
+    """
+    if output_format == "sqlite":
+        return SQLiteStorage(os.path.join(save_path, ARCHIVE_FILE_NAMES["sqlite"]))
+    if output_format == "zip":
+        return ZipStorage(os.path.join(save_path, ARCHIVE_FILE_NAMES["zip"]))
+    return TreeStorage(save_path)
+
+
+def exportArchive(output_format, save_path, dest_path):
+    """
+    Expand a packed archive into the directory tree layout, return the number of files
+    """
+    storage = openStorage(output_format, save_path)
+    tree = TreeStorage(dest_path)
+    file_count = 0
+    try:
+        for relative_path, content in storage.iterFiles():
+            tree.write(relative_path, [content])
+            file_count = file_count + 1
+    finally:
+        storage.close()
+    return file_count
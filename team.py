@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from client import LeetCodeClient
+from network import RateLimiter
+from cache import ResponseCache
+from metrics import writeAtomically
+
+
+class TeamResources:
+    """
+    Resources shared by the accounts crawled in one process:
+    the statement cache, the rate limiter to the server and the worker pool
+    """
+    def __init__(self, args):
+        self.rate_limiter = RateLimiter(args.rate)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, args.workers))
+        self.__temp_cache_dir = None
+        cache_dir = args.cache_dir
+        if args.no_cache:  # still share the statements within this run
+            self.__temp_cache_dir = tempfile.mkdtemp(prefix="lc_team_cache_")
+            cache_dir = self.__temp_cache_dir
+        self.cache = ResponseCache(cache_dir, {"questionData": 30 * 24 * 3600}, max_size=args.cache_size * 1024 * 1024)
+
+
+    def close(self):
+        self.executor.shutdown()
+        if self.__temp_cache_dir is not None:
+            shutil.rmtree(self.__temp_cache_dir, ignore_errors=True)
+
+
+def loadAccounts(accounts_file, save_path, session_file):
+    """
+    Read the accounts config, a JSON list (or {"accounts": [...]}) of
+        { "username": ..., "password": ... (or "password_env": name of environment variable),
+          "output": output folder, default problems/<username>,
+          "session_file": default session-<username>.json beside --session-file }
+    """
+    with open(accounts_file, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if isinstance(config, dict):
+        config = config["accounts"]
+
+    accounts = []
+    for account in config:
+        username = account["username"]
+        password = account.get("password")
+        if password is None and "password_env" in account:
+            password = os.environ.get(account["password_env"])
+        output = account.get("output", username)
+        accounts.append({
+            "username": username,
+            "password": password,
+            "save_path": output if os.path.isabs(output) else os.path.join(save_path, output),
+            "session_file": account.get("session_file",
+                                        os.path.join(os.path.dirname(session_file), "session-{:s}.json".format(username)))
+        })
+    return accounts
+
+
+def crawlTeam(args, save_path):
+    """
+    Crawl the accounts of --accounts in one process, each with its own session and output folder.
+    Return the reports of accounts, None for the ones failed to login.
+    """
+    accounts = loadAccounts(args.accounts, save_path, args.session_file)
+    print(" >> {:d} accounts will be grasped.".format(len(accounts)))
+
+    team = TeamResources(args)
+    try:
+        # one thread for each account, their problems are grasped by the pool of team
+        with ThreadPoolExecutor(max_workers=len(accounts)) as executor:
+            reports = list(executor.map(lambda account: crawlAccount(account, args, team), accounts))
+    finally:
+        team.close()
+
+    print(" >> {:20s} {:>8s} {:>8s} {:>10s} {:>10s}".format("ACCOUNT", "GRASPED", "FAILED", "REQUESTS", "SECONDS"))
+    for account, report in zip(accounts, reports):
+        if report is None:
+            print(" >> {:20s} {:>8s}".format(account["username"], "LOGIN FAILED"))
+            continue
+        print(" >> {:20s} {:8d} {:8d} {:10d} {:10.1f}".format(account["username"], report["problems_done"],
+              report["problems_failed"], report["requests"], report["elapsed"]))
+
+    report_file = args.report if args.report is not None else os.path.join(save_path, "team_report.json")
+    writeAtomically(report_file, json.dumps({account["username"]: report for account, report in zip(accounts, reports)},
+                                            indent=2, ensure_ascii=False))
+    print(" >> Team report saved to {:s}".format(report_file))
+    return reports
+
+
+def crawlAccount(account, args, team):
+    account_args = copy.copy(args)
+    account_args.report = None  # in the output folder of account
+    if args.prometheus is not None:
+        prometheus_root, prometheus_ext = os.path.splitext(args.prometheus)
+        account_args.prometheus = "{:s}-{:s}{:s}".format(prometheus_root, account["username"], prometheus_ext)
+
+    lc_client = LeetCodeClient(account["save_path"], account_args, team)
+    try:
+        if args.no_session or not lc_client.restoreSession(account["session_file"], account["username"]):
+            if account["password"] is None:
+                print(" >> No password of account {:s}.".format(account["username"]))
+                return None
+            if not lc_client.login(account["username"], account["password"]):
+                return None
+            if not args.no_session:
+                lc_client.saveSession(account["session_file"], account["username"])
+        return lc_client.graspAllProblems(args.book)
+    finally:
+        lc_client.close()
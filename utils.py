@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
+import json
+import hashlib
+import contextlib
 
 LANG_SLUG_TRANSFORM = {
-    "cpp": "C++", "java": "JAVA", "python": "Python", "python3": "Python3",
+    "cpp": "C++", "java": "Java", "python": "Python", "python3": "Python3",
     "c": "C", "csharp": "C#", "javascript": "JavaScript", "ruby": "Ruby",
     "swift": "Swift", "golang": "Go", "scala": "Scala", "kotlin": "Kotlin",
     "rust": "Rust", "php": "PHP", "typescript": "TypeScript",
-    "racket": "Racket", "mysql": "MySQL"
+    "racket": "Racket", "mysql": "MySQL", "mssql": "MS SQL Server",
+    "oraclesql": "Oracle", "bash": "Bash"
 }
 
 LANG_FILE_FORMAT = {
@@ -15,7 +20,8 @@ LANG_FILE_FORMAT = {
     "Go": ".go", "Java": ".java", "C": ".c", "JavaScript": ".js",
     "PHP": ".php", "C#": ".cs", "Ruby": ".rb", "Swift": ".swift",
     "Scala": ".scl", "Kotlin": ".kt", "Rust": ".rs",
-    "TypeScript": ".ts", "Racket": ".rkt"
+    "TypeScript": ".ts", "Racket": ".rkt", "MS SQL Server": ".sql",
+    "Oracle": ".sql", "Bash": ".sh"
 }
 
 DIFFICULTY_TRANSFORM = {
@@ -36,69 +42,149 @@ BOOK_TRANSFORM = {
 }
 
 
-def saveListFile(file_path, file_name, book_name, problems_info):
-    if not os.path.exists(file_path):
-        os.makedirs(file_path)
-
-    with open(os.path.join(file_path, file_name+".html"), "w", encoding="utf-8") as f:
-        f.write(
-            "<title>{:s} 题目与题解汇总</title>\n".format(BOOK_TRANSFORM[book_name])+
-            "<style>\n"+
-            "    .table_list table { width: 100%; margin: 15px 0; border: 0; }\n"+
-            "    .table_list th { background-color: #96C7ED; color: #FFFFFF; }\n"+
-            "    .table_list,.table_list th,.table_list td { font-size: 0.95em; text-align: center; padding: 4px; border-collapse: collapse; }\n"+
-            "    .table_list th,.table_list td { border: 1px solid #73b4e7; border-width: 1px 0 1px 0; border: 2px inset #ffffff; }\n"+
-            "    .table_list tr { border: 1px solid #ffffff; }\n"+
-            "    .table_list tr:nth-child(odd){ background-color: #dcecf9; }\n"+
-            "    .table_list tr:nth-child(even){ background-color: #ffffff; }\n"+
-            "</style>\n"+
-            "<h2 style=\"text-align:center;\">{:s} 题目与题解汇总</h2>\n".format(BOOK_TRANSFORM[book_name])+
-            "<table class=table_list align=\"center\">\n"+
-            "<tr>\n"+
-            "    <th>题目ID</th><th>题目名称</th><th>题目链接</th><th>题解链接</th>\n"+
-            "</tr>\n")
-        
-        sorted_problems_info = sorted(problems_info, key=lambda k: k["qid"])
-        for info in sorted_problems_info:
-            problem_dir = "{:s} - {:s}".format(info["qid"], info["translated_title"])
-            file_list = os.listdir(os.path.join(file_path, problem_dir))  # to get code file name
-            for file in file_list:
-                if file[-5:] == ".html":
-                    file_list.remove(file)
-                    break
-            problem_path = os.path.join(problem_dir, info["translated_title"]+".html")
-            code_path = os.path.join(problem_dir, file_list[0])
-
-            f.write("<tr>\n")
-            f.write("<td>{:s}</td>".format(info["qid"]) +
-                    "<td>{:s}</td>".format(info["translated_title"]) +
-                    "<td><a href=\"{:s}\">题目</a></td>".format(problem_path) +
-                    "<td><a href=\"{:s}\">题解</a></td>\n".format(code_path)
-            )
-            f.write("</tr>\n")
-
-        f.write("</table>\n")
-
-
-def saveProblemFile(file_path, file_name, file_title, difficulty, content):
-    if not os.path.exists(file_path):
-        os.makedirs(file_path)
-
-    with open(os.path.join(file_path, file_name+".html"), "w", encoding="utf-8") as f:
-        f.write("<title>{:s}</title>\n".format(file_title))
-        f.write("<h2>{:s}</h2>\n".format(file_title))  # write problem title
-
-        f.write("<h4>{:s} {:s}</h4>\n".format(
-                DIFFICULTY_TRANSFORM["Default"], DIFFICULTY_TRANSFORM[difficulty]))  # write difficulty
-
-        f.write(content)
-
-
-def saveCodeFile(file_path, file_name, lang, content):
-    if not os.path.exists(file_path):
-        os.makedirs(file_path)
-
-    file_format = LANG_FILE_FORMAT[LANG_SLUG_TRANSFORM[lang]]
-    with open(os.path.join(file_path, file_name+file_format), "w", encoding="utf-8") as f:
-        f.write(content)
+LIST_FILE_STYLE = (
+    "<style>\n"+
+    "    .table_list table { width: 100%; margin: 15px 0; border: 0; }\n"+
+    "    .table_list th { background-color: #96C7ED; color: #FFFFFF; }\n"+
+    "    .table_list,.table_list th,.table_list td { font-size: 0.95em; text-align: center; padding: 4px; border-collapse: collapse; }\n"+
+    "    .table_list th,.table_list td { border: 1px solid #73b4e7; border-width: 1px 0 1px 0; border: 2px inset #ffffff; }\n"+
+    "    .table_list tr { border: 1px solid #ffffff; }\n"+
+    "    .table_list tr:nth-child(odd){ background-color: #dcecf9; }\n"+
+    "    .table_list tr:nth-child(even){ background-color: #ffffff; }\n"+
+    "    .page_nav, .search_box { text-align: center; margin: 8px; }\n"+
+    "</style>\n")
+
+LIST_FILE_HEAD_ROW = "<tr>\n    <th>题目ID</th><th>题目名称</th><th>题目链接</th><th>题解链接</th>\n</tr>\n"
+
+LIST_FILE_SCRIPT = """<script src="search_index.js"></script>
+<script>
+var DIFFICULTY_NAME = {"Easy": "简单", "Medium": "中等", "Hard": "困难"};
+var SEARCH_TEXTS = SEARCH_INDEX.rows.map(function (row) {
+    return [row[0], row[1], row[2], DIFFICULTY_NAME[row[2]] || "", row[3], row[4].join(" ")].join(" ").toLowerCase();
+});
+function searchProblems(keyword) {
+    var pageList = document.getElementById("page_list");
+    var resultList = document.getElementById("search_result");
+    keyword = keyword.trim().toLowerCase();
+    if (keyword === "") {
+        pageList.style.display = "";
+        resultList.style.display = "none";
+        return;
+    }
+    var html = ["<tr>" + pageList.rows[0].innerHTML + "</tr>"];
+    for (var i = 0; i < SEARCH_TEXTS.length; i++) {
+        if (SEARCH_TEXTS[i].indexOf(keyword) < 0) continue;
+        var row = SEARCH_INDEX.rows[i];
+        html.push("<tr><td>" + row[0] + "</td><td>" + row[1] + "</td><td><a href=\\"" + row[5] +
+                  "\\">题目</a></td><td><a href=\\"" + row[6] + "\\">题解</a></td></tr>");
+    }
+    resultList.innerHTML = html.join("");
+    pageList.style.display = "none";
+    resultList.style.display = "";
+}
+</script>
+"""
+
+
+def naturalSortKey(qid):
+    """
+    Sort key of question id, numbers compared by value, e.g. "2" < "100" < "剑指 Offer 03"
+    """
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", qid) if part != ""]
+
+
+def saveListFile(storage, file_path, file_name, book_name, problems_info, page_size=500, old_digests=None, metrics=None):
+    """
+    Write the summary pages of a book (page_size rows per page) and its search index.
+    Each file is generated in memory, the ones with the same digest as old_digests are not written at all.
+    The files written are measured by metrics as "list_file". Return the digests of the files.
+    """
+    old_digests = old_digests if old_digests is not None else {}
+
+    sorted_problems_info = sorted(problems_info, key=lambda k: naturalSortKey(k["qid"]))
+    page_count = max(1, (len(sorted_problems_info) + page_size - 1) // page_size)
+    page_names = [file_name+".html"] + ["{:s}_{:d}.html".format(file_name, page_idx+1) for page_idx in range(1, page_count)]
+
+    digests = {}
+    for page_idx in range(page_count):
+        page_problems_info = sorted_problems_info[page_idx*page_size:(page_idx+1)*page_size]
+        digests[page_names[page_idx]] = writeIfChanged(storage, os.path.join(file_path, page_names[page_idx]),
+                generateListPage(book_name, page_problems_info, page_names, page_idx), old_digests.get(page_names[page_idx]), metrics)
+
+    # remove the pages left by a larger book
+    page_idx = page_count + 1
+    while storage.exists(os.path.join(file_path, "{:s}_{:d}.html".format(file_name, page_idx))):
+        storage.remove(os.path.join(file_path, "{:s}_{:d}.html".format(file_name, page_idx)))
+        page_idx = page_idx + 1
+
+    search_index = {
+        "fields": ["qid", "title", "difficulty", "lang", "tags", "problem", "code"],
+        "rows": [[info["qid"], info["translated_title"], info["difficulty"] or "", info["lang"] or "",
+                  json.loads(info["tags"]) if info["tags"] else [], info["problem_file"], info["code_file"]]
+                 for info in sorted_problems_info]
+    }
+    search_index_json = json.dumps(search_index, ensure_ascii=False, separators=(",", ":"))
+    digests["search_index.json"] = writeIfChanged(storage, os.path.join(file_path, "search_index.json"),
+            [search_index_json], old_digests.get("search_index.json"), metrics)
+    # same index for the page, browsers do not load JSON from local files
+    digests["search_index.js"] = writeIfChanged(storage, os.path.join(file_path, "search_index.js"),
+            ["var SEARCH_INDEX = ", search_index_json, ";\n"], old_digests.get("search_index.js"), metrics)
+    return digests
+
+
+def writeIfChanged(storage, relative_path, chunks, old_digest, metrics=None):
+    """
+    Write the file only if its digest changed or it is missing, return the digest
+    """
+    content = "".join(chunks).encode("utf-8")
+    digest = hashlib.sha1(content).hexdigest()
+    if digest != old_digest or not storage.exists(relative_path):
+        with metrics.writing("list_file", len(content)) if metrics is not None else contextlib.nullcontext():
+            storage.write(relative_path, [content])
+    return digest
+
+
+def generateListPage(book_name, problems_info, page_names, page_idx):
+    """
+    Generate the summary page piece by piece
+    """
+    yield "<title>{:s} 题目与题解汇总</title>\n".format(BOOK_TRANSFORM[book_name])
+    yield LIST_FILE_STYLE
+    yield "<h2 style=\"text-align:center;\">{:s} 题目与题解汇总</h2>\n".format(BOOK_TRANSFORM[book_name])
+    yield "<div class=search_box><input size=40 placeholder=\"搜索题目ID、名称、难度、语言或标签\" oninput=\"searchProblems(this.value)\"></div>\n"
+    if len(page_names) > 1:
+        nav_items = []
+        for idx in range(len(page_names)):
+            if idx == page_idx:
+                nav_items.append("<b>{:d}</b>".format(idx+1))
+            else:
+                nav_items.append("<a href=\"{:s}\">{:d}</a>".format(page_names[idx], idx+1))
+        yield "<div class=page_nav>{:s}</div>\n".format(" | ".join(nav_items))
+    yield "<table class=table_list align=\"center\" id=\"search_result\" style=\"display:none\"></table>\n"
+    yield "<table class=table_list align=\"center\" id=\"page_list\">\n"
+    yield LIST_FILE_HEAD_ROW
+
+    for info in problems_info:
+        yield ("<tr>\n<td>{:s}</td><td>{:s}</td><td><a href=\"{:s}\">题目</a></td><td><a href=\"{:s}\">题解</a></td>\n</tr>\n"
+               .format(info["qid"], info["translated_title"], info["problem_file"], info["code_file"]))
+
+    yield "</table>\n"
+    yield LIST_FILE_SCRIPT
+
+
+def renderProblemFile(file_title, difficulty, content):
+    return [
+        "<title>{:s}</title>\n".format(file_title),
+        "<h2>{:s}</h2>\n".format(file_title),  # write problem title
+        "<h4>{:s} {:s}</h4>\n".format(
+                DIFFICULTY_TRANSFORM["Default"], DIFFICULTY_TRANSFORM[difficulty]),  # write difficulty
+        content
+    ]
+
+
+def codeFileName(file_name, lang):
+    """
+    Code of languages not listed above is still saved, as a text file
+    """
+    return file_name + LANG_FILE_FORMAT.get(LANG_SLUG_TRANSFORM.get(lang), ".txt")
 